@@ -11,37 +11,32 @@ class BioImporter(BaseImporter):
         super().__init__(command=__file__, argv=argv)
         self._database = "hmdd2.0"
 
-    @staticmethod
-    def get_embl_size(miRNA_dat):
-        return sum(1 for record in SeqIO.parse(miRNA_dat, "embl")
-                   if record.name.startswith("hsa"))
-
-    @staticmethod
-    def get_rows(miRNA_dat):
-        for record in SeqIO.parse(miRNA_dat, "embl"):
-            if not record.name.startswith("hsa"):
-                continue
-            if len(record.name) < 2:
-                continue
-            yield {
-                "name": record.name.lower(),
-                "description": record.description,
-                "seq": record.seq.__str__(),
-                "comment": record.annotations.get('comment', ''),
-                "references": [
-                    {"authors": r.authors, "title": r.title,
-                     "pubmed_id": r.pubmed_id, "journal": r.journal}
-                    for r in (record.annotations
-                              .get('references', []))],
-                "features": [
-                    {"type": r.type,
-                     "accession": (r.qualifiers
-                                   .get('accession', [""])[0]),
-                     "name": (r.qualifiers
-                              .get('product', [""])[0]
-                              .lower())}
-                    for r in record.features if r.type == "miRNA"]
-            }
+    def get_rows(self, miRNA_dat):
+        with self.open_input(miRNA_dat) as in_file:
+            for record in SeqIO.parse(in_file, "embl"):
+                if not record.name.startswith("hsa"):
+                    continue
+                if len(record.name) < 2:
+                    continue
+                yield {
+                    "name": record.name.lower(),
+                    "description": record.description,
+                    "seq": record.seq.__str__(),
+                    "comment": record.annotations.get('comment', ''),
+                    "references": [
+                        {"authors": r.authors, "title": r.title,
+                         "pubmed_id": r.pubmed_id, "journal": r.journal}
+                        for r in (record.annotations
+                                  .get('references', []))],
+                    "features": [
+                        {"type": r.type,
+                         "accession": (r.qualifiers
+                                       .get('accession', [""])[0]),
+                         "name": (r.qualifiers
+                                  .get('product', [""])[0]
+                                  .lower())}
+                        for r in record.features if r.type == "miRNA"]
+                }
 
     def import_miRNA_dat(self, miRDB_file):
         query = """
@@ -66,8 +61,9 @@ class BioImporter(BaseImporter):
                               r.journal = reference.journal
                 MERGE (m)-[:HAS_REFERENCE]->(r)
             """
-        size = self.get_embl_size(miRDB_file)
-        self.batch_store(query, self.get_rows(miRDB_file), size=size)
+        # the hsa records are parsed once and spooled, re-imports of the same file read the spool without Biopython
+        records = self.spooled("hsa_records", self.get_rows(miRDB_file), source=miRDB_file, desc="parsing EMBL")
+        self.batch_store(query, records, size=len(records), checkpoint=records.directory)
 
 
 #   https://www.mirbase.org/ftp/CURRENT/miRNA.dat.gz
@@ -85,7 +81,7 @@ def main():
         print(base_path, "isn't a directory")
         sys.exit(1)
 
-    miRNA_dat = base_path / "miRNA.dat"
+    miRNA_dat = importing.find_input(base_path / "miRNA.dat")
 
     if not miRNA_dat.is_file():
         print(miRNA_dat, "doesn't exist in ", base_path)
@@ -10,13 +10,8 @@ class MiRDBImporter(BaseImporter):
         super().__init__(command=__file__, argv=argv)
         self._database = "hmdd2.0"
 
-    @staticmethod
-    def get_csv_size(miRDB_file, encoding="utf-8"):
-        reader = csv.reader(miRDB_file.open(), delimiter='\t')
-        return sum(1 for record in reader if record[0].startswith("hsa"))
-
     def get_rows(self, miRDB_file):
-        with miRDB_file.open("r") as in_file:
+        with self.open_input(miRDB_file, newline='') as in_file:
             reader = csv.reader(in_file, delimiter='\t')
             header = ("name", "target", "value")
             for row in reader:
@@ -26,16 +21,28 @@ class MiRDBImporter(BaseImporter):
                 yield record
 
     def import_miRDB(self, miRDB_file):
+        # the targets are merged once per batch, in a stable order, and only for the rows whose MiRNA is in the graph
         query = """
-                    UNWIND $batch as item 
+                    UNWIND $batch as item
                     MATCH (m:MiRNA {name: toLower(item.name)})
                     SET m:MiRNA_RDB
-                    MERGE (t:Target {name: item.target})
+                    WITH collect({m: m, item: item}) as matched
+                    CALL {
+                        WITH matched
+                        UNWIND matched as row
+                        WITH DISTINCT row.item.target as target
+                        ORDER BY target
+                        MERGE (:Target {name: target})
+                        RETURN count(*) as ignored
+                    }
+                    UNWIND matched as row
+                    WITH row.m as m, row.item as item
+                    MATCH (t:Target {name: item.target})
                     MERGE (m)-[r:HAS_TARGET]->(t)
                     SET r.value= toFloat(item.value)
                 """
-        size = self.get_csv_size(miRDB_file)
-        self.batch_store(query, self.get_rows(miRDB_file), size=size, strategy="aggregate")
+        self.batch_store(query, self.get_rows(miRDB_file), strategy="aggregate",
+                         fingerprint=lambda item: (item["name"], item["target"]))
 
 
 def main():
@@ -4,6 +4,7 @@ from pathlib import Path
 
 from util.base_importer import BaseImporter
 from util.graphdb_base import GraphDBBase
+from util.name_matcher import NameMatcher
 
 
 class BioImporter(BaseImporter):
@@ -11,13 +12,8 @@ class BioImporter(BaseImporter):
         super().__init__(command=__file__, argv=argv)
         self._database = "hmdd2.0"
 
-    @staticmethod
-    def get_csv_size(HMDD_file, encoding="utf-8"):
-        return sum(1 for row in BioImporter.get_rows(HMDD_file))
-
-    @staticmethod
-    def get_rows(miRNA_file):
-        with open(miRNA_file, 'r+') as in_file:
+    def get_rows(self, miRNA_file):
+        with self.open_input(miRNA_file, newline='') as in_file:
             reader = csv.reader(in_file, delimiter='\t')
             header = next(reader)
             for row in reader:
@@ -60,28 +56,44 @@ class BioImporter(BaseImporter):
                 SET r.source = 'dbDEMC', r.experiment = item.experiment
                 return id(m) as id, id(n)
         """
-        size = self.get_csv_size(miRDB_file)
-        self.batch_store(exact_match_query, self.get_rows(miRDB_file), size=size)
+        self.batch_store(exact_match_query, self.get_rows(miRDB_file))
+
+    def get_disease_matcher(self):
+        """
+        The names of the diseases, as referred to by their resources, loaded once for client side matching
+          The diseases are keyed by their unique name, internal ids are not stable across sessions.
+        """
+        with self._driver.session(database=self._database) as session:
+            names = session.run("""
+                MATCH (n:Disease)-[:REFERS_TO]->(resource)<-[:NAME_REFERS_TO]-(diseaseName)
+                RETURN n.name AS key, diseaseName.label AS name
+            """).values()
+        return NameMatcher(names, threshold=0.9)
+
+    def get_matched_rows(self, miRDB_file, matcher: NameMatcher):
+        """The rows of get_rows with the name of every disease their disease matches, one row per disease"""
+        for row in self.get_rows(miRDB_file):
+            for disease_name in matcher.match(row["disease"]):
+                yield {**row, "disease_name": disease_name}
 
     def import_miR2Disease(self, miRDB_file):
+        # the diseases are matched by the NameMatcher, equal names or the same tokens with a Jaro-Winkler
+        # similarity above 0.9, instead of comparing every row to every disease name in the query
         indirect_approximate_match_query = """
                                     UNWIND $batch as item
                                     MATCH (m:MiRNA)
                                     WHERE m.name = item.name
                                     SET m:MiRNAdbDEMC
-                                    MATCH (n:Disease)-[:REFERS_TO]->(resource)<-[:NAME_REFERS_TO]-(diseaseName)
+                                    WITH m, item
+                                    MATCH (n:Disease {name: item.disease_name})
                                     WHERE NOT EXISTS ((m)-[:REGULATES]->(n))
-                                    WITH m, item, n, disease, diseaseName, [x IN split(diseaseName.label, " ") | trim(x)] as terms, [x in split(disease, " ") | trim(x)] as splitDisease
-                                    WITH m, item, n, disease, diseaseName, apoc.coll.intersection(terms, splitDisease) as intersect, splitDisease, apoc.text.jaroWinklerDistance(disease, toLower(diseaseName.label)) as similarity
-                                    WHERE toLower(diseaseName.label) = disease OR (size(splitDisease) = size(terms) AND size(intersect) = size(terms) and similarity > 0.9)
-                                    WITH m, item, n, disease
                                     SET n:DiseaseDbDEMC, n.name_in_db_demc = item.disease
                                     MERGE (m)-[r:REGULATES {regulated: item.regulated}]->(n)
                                     SET r.source = 'dbDEMC', r.type = "indirect_approximate"
                                     return id(m) as id, id(n)
                                 """
-        size = self.get_csv_size(miRDB_file)
-        self.batch_store(indirect_approximate_match_query, self.get_rows(miRDB_file), size=size)
+        matcher = self.get_disease_matcher()
+        self.batch_store(indirect_approximate_match_query, self.get_matched_rows(miRDB_file, matcher))
 
 
 class OLDBioImporter(GraphDBBase):
@@ -2,63 +2,67 @@ import csv
 import sys
 from pathlib import Path
 
-from neo4j.exceptions import ClientError as Neo4jClientError
-
 from util.base_importer import BaseImporter
+from util.bulk_export import NodeExport, RelationshipExport
 
 
 class HMDDImporter(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self._database = "hmdd2.0"
+        self.schema = ["CREATE CONSTRAINT IF NOT EXISTS FOR (a:Disease) REQUIRE a.name IS UNIQUE",
+                       "CREATE CONSTRAINT IF NOT EXISTS FOR (a:MiRNA) REQUIRE a.name IS UNIQUE",
+                       "CREATE CONSTRAINT IF NOT EXISTS FOR (a:Reference) REQUIRE a.pubmed_id IS UNIQUE",
+                       "CREATE CONSTRAINT IF NOT EXISTS FOR (a:Target) REQUIRE a.name IS UNIQUE"]
 
     def get_rows(self, HMDD_file):
-        with open(HMDD_file, 'r+', encoding="latin-1") as in_file:
+        with self.open_input(HMDD_file, encoding="latin-1", newline='') as in_file:
             reader = csv.reader(in_file, delimiter='\t')
             header = next(reader)
             for row in reader:
-                yield dict(zip(header, row))
+                row = dict(zip(header, row))
+                # the node keys, normalized once for the deduplication, the fingerprint and the query
+                row["disease"] = row["disease"].lower().strip()
+                row["mir"] = row["mir"].lower()
+                yield row
 
     def import_HMDD(self, HMDD_file):
         query = """
-            UNWIND $batch as item
-            WITH trim(toLower(item.disease)) as disease, toLower(item.mir) as mir,item
-            MERGE (d:Disease {name: disease})
-            MERGE (m:MiRNA {name:mir})
+            UNWIND $diseases as disease
+            MERGE (:Disease {name: disease})
+            WITH count(*) as ignored
+            UNWIND $mirs as mir
+            MERGE (m:MiRNA {name: mir})
             SET m:MiRNA_HMDD
+            WITH count(*) as ignored
+            UNWIND $references as pmid
+            MERGE (:Reference {pubmed_id: pmid})
+            WITH count(*) as ignored
+            UNWIND $batch as item
+            MATCH (d:Disease {name: item.disease})
+            MATCH (m:MiRNA {name: item.mir})
             MERGE (m)-[r:RELATED_TO]->(d)
             SET r.description = item.description, r.pmid=item.pmid, r.category = item.category
-            MERGE (ref:Reference {pubmed_id:item.pmid})
+            WITH m, item
+            MATCH (ref:Reference {pubmed_id:item.pmid})
             MERGE (m)-[:HAS_REFERENCE]->(ref)
         """
-        size = self.get_csv_size(HMDD_file, encoding="latin-1")
-        self.batch_store(query, self.get_rows(HMDD_file), size=size, strategy="aggregate")
-
-    def set_constraints(self):
-        ver = self._driver.verify_connectivity()
-        with self._driver.session(database=self._database) as session:
-            if ver.startswith("Neo4j/5"):
-                query = """
-                    CREATE CONSTRAINT FOR (a:Disease) REQUIRE a.name IS UNIQUE;
-                    CREATE CONSTRAINT FOR (a:MiRNA) REQUIRE a.name IS UNIQUE;
-                    
-                    CREATE CONSTRAINT FOR (a:Reference) REQUIRE a.pubmed_id IS UNIQUE;
-                    CREATE CONSTRAINT FOR (a:Target) REQUIRE a.name IS UNIQUE
-                """
-            else:
-                query = """
-                    CREATE CONSTRAINT ON (a:Disease) ASSERT a.name IS UNIQUE;
-                    CREATE CONSTRAINT ON (a:MiRNA) ASSERT a.name IS UNIQUE;
-                    
-                    CREATE CONSTRAINT ON (a:Reference) ASSERT a.pubmed_id IS UNIQUE;
-                    CREATE CONSTRAINT ON (a:Target) ASSERT a.name IS UNIQUE"""
-            for q in query.split(";"):
-                try:
-                    session.run(q)
-                except Neo4jClientError as e:
-                    # ignore if we already have the rule in place
-                    if e.code != "Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists":
-                        raise e
+        # each disease, miRNA and reference is merged once per batch instead of once per row
+        dedup = {"diseases": "disease", "mirs": "mir", "references": "pmid"}
+        # with --incremental only the associations new or changed since the previous import are sent
+        fingerprint = lambda item: (item["mir"], item["disease"], item["pmid"])
+        self.batch_store(query, self.get_rows(HMDD_file), strategy="aggregate", dedup=dedup, fingerprint=fingerprint)
+
+    def export_HMDD(self, HMDD_file):
+        disease = NodeExport("Disease", "name", "disease")
+        mirna = NodeExport("MiRNA:MiRNA_HMDD", "name", "mir")
+        reference = NodeExport("Reference", "pubmed_id", "pmid")
+        relationships = [RelationshipExport("RELATED_TO", mirna, disease,
+                                            {"description": "description", "pmid": "pmid", "category": "category"},
+                                            merge_on=[]),
+                         RelationshipExport("HAS_REFERENCE", mirna, reference)]
+
+        self.export_store(self.get_rows(HMDD_file), [disease, mirna, reference], relationships)
 
 
 def main():
@@ -81,8 +85,11 @@ def main():
         print(HMDD_file, "doesn't exist in ", base_path)
         sys.exit(1)
 
-    importing.set_constraints()
-    importing.import_HMDD(HMDD_file)
+    if importing.export_dir:
+        importing.export_HMDD(HMDD_file)
+    else:
+        importing.set_constraints()
+        importing.import_HMDD(HMDD_file)
 
     importing.close()
 
@@ -12,7 +12,7 @@ class Mir2DiseaseImporter(BaseImporter):
         self._database = "hmdd2.0"
 
     def get_rows(self, miRDB_file):
-        with open(miRDB_file, 'r+') as in_file:
+        with self.open_input(miRDB_file, newline='') as in_file:
             reader = csv.reader(in_file, delimiter='\t')
             for row in reader:
                 if len(row) < 2:
@@ -32,8 +32,7 @@ class Mir2DiseaseImporter(BaseImporter):
             MERGE (m)-[r:REGULATES]->(d)
             SET r.regulation = item.regulated
         """
-        size = self.get_csv_size(miR2Disease_file)
-        self.batch_store(query, self.get_rows(miR2Disease_file), size=size, strategy="aggregate")
+        self.batch_store(query, self.get_rows(miR2Disease_file), strategy="aggregate", desc="miR2Disease")
 
     def import_miR2Disease_old(self, miR2Disease_file):
         query = """
@@ -53,8 +52,7 @@ class Mir2DiseaseImporter(BaseImporter):
                     MERGE (m)-[r:REGULATES {regulated: item.regulated}]->(n)
                     return id(m) as id, id(n)
                 """
-        size = self.get_csv_size(miR2Disease_file)
-        self.batch_store(query, self.get_rows(miR2Disease_file), size=size, strategy="aggregate")
+        self.batch_store(query, self.get_rows(miR2Disease_file), strategy="aggregate")
 
 
 def main():
@@ -1,3 +1,4 @@
+import os
 import sys
 from pathlib import Path
 
@@ -5,6 +6,7 @@ import numpy as np
 import pandas as pd
 
 from util.base_importer import BaseImporter
+from util.payload import ColumnarRows
 
 
 class MatrixSimilarityImporter(BaseImporter):
@@ -12,25 +14,44 @@ class MatrixSimilarityImporter(BaseImporter):
         super().__init__(command=__file__, argv=argv)
         self._database = "hmdd2.0"
 
+    @staticmethod
+    def load_matrix(similarity_file):
+        """
+        The similarity matrix, parsed once with np.loadtxt and cached next to it as a .npy file
+        that the later runs open with mmap_mode instead of parsing the text again
+        """
+        similarity_file = Path(similarity_file)
+        cache = similarity_file.with_suffix(".npy")
+        if not cache.is_file() or cache.stat().st_mtime < similarity_file.stat().st_mtime:
+            matrix = np.loadtxt(similarity_file)
+            # written aside and renamed, so that an interrupted run never leaves a truncated cache
+            tmp = cache.with_suffix(".tmp.npy")
+            try:
+                np.save(tmp, matrix)
+                os.replace(tmp, cache)
+            except OSError:
+                tmp.unlink(missing_ok=True)
+                return matrix
+        return np.load(cache, mmap_mode="r")
+
+    @staticmethod
+    def similar_pairs(matrix, threshold):
+        """The rows, columns and values of the lower-triangle cells, diagonal excluded, above threshold"""
+        rows, columns = np.tril_indices(matrix.shape[0], k=-1)
+        values = matrix[rows, columns]
+        above = values > threshold
+        return rows[above], columns[above], values[above]
+
     def getMatrixSize(self, similarity_file, threshold):
-        matrix = np.loadtxt(similarity_file)
-        # count the number of items exceeding the threshold in a flatted version of the matrix
-        # (True counts as 1, False counts as 0)
-        # only lower  lower-triangle without counting the 1s on diagolan
-        return sum(np.tril(matrix).flatten() > threshold) - matrix.shape[0]
+        return len(self.similar_pairs(self.load_matrix(similarity_file), threshold)[0])
 
     def get_rows(self, names_file, similarity_file, threshold):
-        names = pd.read_excel(names_file, header=None)[0].tolist()
-        matrix = np.loadtxt(similarity_file)
+        """The similar pairs as columns, batched by slicing the arrays instead of building a dict per pair"""
+        names = np.array([name.lower() for name in pd.read_excel(names_file, header=None)[0].tolist()], dtype=object)
+        matrix = self.load_matrix(similarity_file)
         assert matrix.shape == (len(names), len(names)), "names count and adjiacenty matrix mismatch"
-        for i, name_src in enumerate(names):
-            for j, name_dst in enumerate(names):
-                if j < i:
-                    similarity_value = matrix[i][j]
-                    if similarity_value > threshold:
-                        yield {"sourceName": name_src.lower(),
-                               "destinationName": name_dst.lower(),
-                               "value": float(similarity_value)}
+        rows, columns, values = self.similar_pairs(matrix, threshold)
+        return ColumnarRows(sourceName=names[rows], destinationName=names[columns], value=values)
 
     def import_similarity_matrix(self, names_file, similarity_file, threshold=0):
         query = """
@@ -40,8 +61,8 @@ class MatrixSimilarityImporter(BaseImporter):
                 MERGE (source)-[r:SIMILAR_TO ]->(destination)
                 SET r.value = item.value
             """
-        size = self.getMatrixSize(similarity_file, threshold)
-        self.batch_store(query, self.get_rows(names_file, similarity_file, threshold), size=size)
+        rows = self.get_rows(names_file, similarity_file, threshold)
+        self.batch_store(query, rows, size=len(rows), columnar=True)
 
 
 def main():
@@ -3,9 +3,9 @@ from pathlib import Path
 
 import spacy
 import pytextrank
-from neo4j.exceptions import ClientError as Neo4jClientError
 
 from util.base_importer import BaseImporter
+from util.keyset_reader import KeysetReader
 
 
 class BBCImporter(BaseImporter):
@@ -13,35 +13,26 @@ class BBCImporter(BaseImporter):
         super().__init__(command=__file__, argv=argv)
         self._database = "news"
 
+        # CREATE DATABASE news
+        self.schema = ["CREATE CONSTRAINT doc_id_unique IF NOT EXISTS FOR (n:Document) REQUIRE n.id IS UNIQUE",
+                       "CREATE CONSTRAINT person_name_unique IF NOT EXISTS FOR (n:Person) REQUIRE n.name IS UNIQUE",
+                       "CREATE CONSTRAINT location_name_unique IF NOT EXISTS FOR (n:Location) REQUIRE n.name IS UNIQUE",
+                       "CREATE CONSTRAINT organization_name_unique IF NOT EXISTS FOR (n:Organization) REQUIRE n.name IS UNIQUE",
+                       "CREATE CONSTRAINT date_name_unique IF NOT EXISTS FOR (n:Date) REQUIRE n.name IS UNIQUE",
+                       "CREATE CONSTRAINT money_name_unique IF NOT EXISTS FOR (n:Money) REQUIRE n.name IS UNIQUE",
+                       "CREATE CONSTRAINT number_name_unique IF NOT EXISTS FOR (n:Number) REQUIRE n.name IS UNIQUE",
+                       "CREATE CONSTRAINT group_name_unique IF NOT EXISTS FOR (n:NatReligPolitGroup) REQUIRE n.name IS UNIQUE",
+                       "CREATE CONSTRAINT workofart_name_unique IF NOT EXISTS FOR (n:WorkOfArt) REQUIRE n.name IS UNIQUE",
+                       "CREATE CONSTRAINT keyword_name_unique IF NOT EXISTS FOR (n:Keyword) REQUIRE n.name IS UNIQUE"]
+        self.apply_schema()
+
+    @staticmethod
+    def load_nlp():
         # load standard English NLP and NER models
         #  NORP entity = Nationalities or religious or political groups
         #  FAC entity = Buildings, airports, highways, bridges etc.
         #  GPE entity = Countries, cities, states
-        self.nlp = spacy.load("en_core_web_sm")
-
-        # CREATE DATABASE news
-        self.create_indices()
-
-    def create_indices(self):
-        with self._driver.session(database=self._database) as session:
-            query = """
-            CREATE CONSTRAINT doc_id_unique IF NOT EXISTS FOR (n:Document) REQUIRE n.id IS UNIQUE;
-            CREATE CONSTRAINT person_name_unique IF NOT EXISTS FOR (n:Person) REQUIRE n.name IS UNIQUE;
-            CREATE CONSTRAINT location_name_unique IF NOT EXISTS FOR (n:Location) REQUIRE n.name IS UNIQUE;
-            CREATE CONSTRAINT organization_name_unique IF NOT EXISTS FOR (n:Organization) REQUIRE n.name IS UNIQUE;
-            CREATE CONSTRAINT date_name_unique IF NOT EXISTS FOR (n:Date) REQUIRE n.name IS UNIQUE;
-            CREATE CONSTRAINT money_name_unique IF NOT EXISTS FOR (n:Money) REQUIRE n.name IS UNIQUE;
-            CREATE CONSTRAINT number_name_unique IF NOT EXISTS FOR (n:Number) REQUIRE n.name IS UNIQUE;
-            CREATE CONSTRAINT group_name_unique IF NOT EXISTS FOR (n:NatReligPolitGroup) REQUIRE n.name IS UNIQUE;
-            CREATE CONSTRAINT workofart_name_unique IF NOT EXISTS FOR (n:WorkOfArt) REQUIRE n.name IS UNIQUE;
-            CREATE CONSTRAINT keyword_name_unique IF NOT EXISTS FOR (n:Keyword) REQUIRE n.name IS UNIQUE"""
-            for q in query.split(";"):
-                try:
-                    session.run(q)
-                except Neo4jClientError as e:
-                    # ignore if we already have the rule in place
-                    if e.code != "Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists":
-                        raise e
+        return spacy.load("en_core_web_sm")
 
     @staticmethod
     def cleanse_entity(en: str):
@@ -63,19 +54,18 @@ class BBCImporter(BaseImporter):
             with file.open('r') as f:
                 try:
                     lines = [x.strip() for x in f if len(x.strip()) > 1]
-                    document = {"topic": file.parent.name, "id": id_, "title": lines[0],
-                                "text": "\n".join(lines[1:])}
-                    self.enrich_document(document)
-                    yield document
+                    yield {"topic": file.parent.name, "id": id_, "title": lines[0], "text": "\n".join(lines[1:])}
                 except UnicodeDecodeError:
                     print(f"UnicodeDecodeError for {id}")
 
-    def enrich_document(self, document: dict):
-        processed = self.nlp(document['title'] + ".\n\n" + document['text'])
+    @staticmethod
+    def enrich_document(nlp, document: dict):
+        processed = nlp(document['title'] + ".\n\n" + document['text'])
         for en in processed.ents:
             if en.label_ not in document:
                 document[en.label_] = list()
-            document[en.label_].append(self.cleanse_entity(en.text))
+            document[en.label_].append(BBCImporter.cleanse_entity(en.text))
+        return document
 
     def import_documents(self, data_path: Path):
         import_document_query = """
@@ -129,17 +119,30 @@ class BBCImporter(BaseImporter):
             )
         """
         size = self.count_documents(data_path)
+        # every row is a whole article with its entities: start small and let the batch size adapt, within
+        # max_batch_bytes
         self.batch_size = 50
-        self.batch_store(import_document_query, self.get_documents(data_path), size=size, desc="importing documents")
+        self.adaptive_batch_size = True
+        # the NLP pipeline runs in worker processes and its output is spooled, so that it runs once per dataset
+        # even when the writes fail
+        documents = self.pipeline(self.get_documents(data_path), self.enrich_document, setup=self.load_nlp,
+                                  ordered=False)
+        documents = self.spooled("documents", documents, source=data_path, size=size, desc="processing documents")
+        self.batch_store(import_document_query, documents, size=len(documents), desc="importing documents",
+                         checkpoint=documents.directory)
 
 
 class BBCKeywordImporter(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self._database = "news"
-        self.nlp = spacy.load("en_core_web_sm")
+
+    @staticmethod
+    def load_nlp():
+        nlp = spacy.load("en_core_web_sm")
         # add keyword extraction to the NLP pipeline
-        self.nlp.add_pipe("textrank")
+        nlp.add_pipe("textrank")
+        return nlp
 
     @staticmethod
     def cleanse_keyword(kw: str):
@@ -155,18 +158,16 @@ class BBCKeywordImporter(BaseImporter):
             return session.run(count_query).single()["total"]
 
     def get_documents(self):
-        query_documents = """
-        MATCH (n:Document)
-        RETURN id(n) AS id, n.title AS title, n.text AS text
-        """
-        with self._driver.session(database=self._database) as session:
-            for document in session.run(query_documents):
-                document = dict(document)
-                processed = self.nlp(document['title'] + ".\n\n" + document['text'])
-                document['keywords'] = [{'name': self.cleanse_keyword(x.text), 'rank': x.rank}
-                                        for x in processed._.phrases
-                                        if len(x.text) > 1][:30]
-                yield document
+        # paged by id, so that no read transaction stays open over all the documents while keywords are written
+        return KeysetReader(self, "Document", "id", query="RETURN id(n) AS id, n.title AS title, n.text AS text")
+
+    @staticmethod
+    def extract_keywords(nlp, document: dict):
+        processed = nlp(document['title'] + ".\n\n" + document['text'])
+        document['keywords'] = [{'name': BBCKeywordImporter.cleanse_keyword(x.text), 'rank': x.rank}
+                                for x in processed._.phrases
+                                if len(x.text) > 1][:30]
+        return document
 
     def import_keyword(self):
         query_store_keywords = """
@@ -179,8 +180,11 @@ class BBCKeywordImporter(BaseImporter):
             SET r.rank = entity.rank
         )"""
         size = self.count_documents()
+        # documents are produced slowly by the NLP pipeline: start small and let the batch size adapt
         self.batch_size = 50
-        self.batch_store(query_store_keywords, self.get_documents(), size=size, desc="importing keywords")
+        self.adaptive_batch_size = True
+        documents = self.pipeline(self.get_documents(), self.extract_keywords, setup=self.load_nlp, ordered=False)
+        self.batch_store(query_store_keywords, documents, size=size, desc="importing keywords")
 
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@ from pathlib import Path
 import requests
 
 from util.base_importer import BaseImporter
+from util.keyset_reader import KeysetReader
 from tenacity import retry, wait_exponential, stop_after_attempt
 
 
@@ -47,11 +48,12 @@ class OrgEnricher(BaseImporter):
         self._database = "news"
         self.cachePath = None
 
+        # run on each page of organizations `n`, see run
         self.QUERY_GET_INPUTS = """
-        MATCH (n:Document)-[:MENTIONS_ORGANIZATION]->(e:Organization)
-        WITH e, count(*) AS c
+        MATCH (:Document)-[:MENTIONS_ORGANIZATION]->(n)
+        WITH n, count(*) AS c
         WHERE c > 4
-        RETURN id(e) AS id, e.name AS name
+        RETURN id(n) AS id, n.name AS name
         """
 
         self.QUERY_STORE_RESULTS = """
@@ -123,9 +125,9 @@ class OrgEnricher(BaseImporter):
     def run(self):
         # Run enrichment
         with self._driver.session(database=self._database) as session:
-            # Get entities to enrich
-            entities = session.run(self.QUERY_GET_INPUTS).data()
-            print(f"Retrieved {len(entities)} entities")
+            # Get entities to enrich, paged by name: the organizations merged by the enrichment are read too,
+            # but no document mentions them
+            entities = KeysetReader(self, "Organization", "name", query=self.QUERY_GET_INPUTS)
 
             print("Retrieving wikidata info for entity:")
             for en in entities:
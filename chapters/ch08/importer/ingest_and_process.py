@@ -2,49 +2,36 @@ import os
 import sys
 import time
 import json
+from itertools import islice
 from pathlib import Path
 from openai import OpenAI
 
 from util.base_importer import BaseImporter
-from neo4j.exceptions import ClientError as Neo4jClientError
+from util.keyset_reader import KeysetReader
 
 
 class DiariesImporter(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self._database = "rac2"
-        self.create_indices()
-
-    def create_indices(self):
-        with self._driver.session(database=self._database) as session:
-            query = """
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:File) REQUIRE n.name IS NODE KEY;
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:Page) REQUIRE n.id IS NODE KEY;
-                CREATE TEXT INDEX node_entity_name IF NOT EXISTS FOR (n:Entity) ON (n.name);
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:Person) REQUIRE n.name_normalized IS NODE KEY;
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:Organization) REQUIRE n.name_normalized IS NODE KEY;
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:Occupation) REQUIRE n.name_normalized IS NODE KEY;
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:Title) REQUIRE n.name_normalized IS NODE KEY;
-                CREATE TEXT INDEX IF NOT EXISTS FOR (n:Person) ON (n.name_normalized);
-                CREATE TEXT INDEX IF NOT EXISTS FOR (n:Organization) ON (n.name_normalized);
-                CREATE TEXT INDEX IF NOT EXISTS FOR (n:Occupation) ON (n.name_normalized);
-                CREATE TEXT INDEX IF NOT EXISTS FOR (n:Title) ON (n.name_normalized);
-                CREATE TEXT INDEX rel_text_entities IF NOT EXISTS FOR ()-[r:RELATED_TO_ENTITY]-() ON (r.type)"""
-            for q in query.split(";"):
-                try:
-                    session.run(q)
-                except Neo4jClientError as e:
-                    # ignore if we already have the rule in place
-                    if e.code != "Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists":
-                        raise e
-
-    @staticmethod
-    def count_diaries(diaries_file):
-        return len(json.load(diaries_file.open()))
+        self.adaptive_batch_size = True
+        self.schema = ["CREATE CONSTRAINT IF NOT EXISTS FOR (n:File) REQUIRE n.name IS NODE KEY",
+                       "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Page) REQUIRE n.id IS NODE KEY",
+                       "CREATE TEXT INDEX node_entity_name IF NOT EXISTS FOR (n:Entity) ON (n.name)",
+                       "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Person) REQUIRE n.name_normalized IS NODE KEY",
+                       "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Organization) REQUIRE n.name_normalized IS NODE KEY",
+                       "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Occupation) REQUIRE n.name_normalized IS NODE KEY",
+                       "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Title) REQUIRE n.name_normalized IS NODE KEY",
+                       "CREATE TEXT INDEX IF NOT EXISTS FOR (n:Person) ON (n.name_normalized)",
+                       "CREATE TEXT INDEX IF NOT EXISTS FOR (n:Organization) ON (n.name_normalized)",
+                       "CREATE TEXT INDEX IF NOT EXISTS FOR (n:Occupation) ON (n.name_normalized)",
+                       "CREATE TEXT INDEX IF NOT EXISTS FOR (n:Title) ON (n.name_normalized)",
+                       "CREATE TEXT INDEX rel_text_entities IF NOT EXISTS FOR ()-[r:RELATED_TO_ENTITY]-() ON (r.type)"]
+        self.apply_schema()
 
     @staticmethod
-    def get_diaries(diaries_file):
-        for diary in json.load(diaries_file.open()):
+    def get_diaries(diaries: list):
+        for diary in diaries:
             diary["file_name"] = "_".join(diary['id'].split("_")[:-1])
             yield diary
 
@@ -59,8 +46,8 @@ class DiariesImporter(BaseImporter):
 
                 MERGE (f)-[:CONTAINS_PAGE]->(p)
                 """
-        size = self.count_diaries(diaries_file)
-        self.batch_store(import_diaries, self.get_diaries(diaries_file), size=size)
+        diaries = json.load(diaries_file.open())
+        self.batch_store(import_diaries, self.get_diaries(diaries), size=len(diaries))
 
 
 class FullKG(BaseImporter):
@@ -73,13 +60,7 @@ class FullKG(BaseImporter):
         self.openai_url = None
 
     def build_kg(self, prompt_path: Path):
-        QUERY_READ = """
-            MATCH (p:Page)
-            WHERE NOT p:GPTProcessed
-            RETURN id(p) AS id,p.id as key, p.text AS text 
-            ORDER BY p.page_idx 
-            LIMIT $limit
-            """
+        QUERY_READ = "RETURN id(n) AS id, n.id AS key, n.text AS text"
         prompt_segments = self.read_prompt(prompt_path)
         self.process_diaries_gpt(QUERY_READ, prompt_segments, n_docs=100)
 
@@ -224,15 +205,16 @@ class FullKG(BaseImporter):
             api_key=self.openai_key,
         )
 
-        print("Reading pages")
-        with self._driver.session(database=self._database) as session:
-            res = session.run(query_read, limit=n_docs)
-            pages = res.data()
-        print(f"Read {len(pages)} pages")
+        # the pages not processed yet are streamed by their id (a node key), in short read transactions, so that
+        # no transaction stays open while GPT runs; only the pages to rerun are kept in memory
+        pages = islice(KeysetReader(self, "Page", "id", where="NOT n:GPTProcessed", query=query_read,
+                                    fetch_size=min(n_docs, 100)), n_docs)
 
         # run GPT & store to Neo4j
+        processed = 0
         failed_pages = list()
         for p in pages:
+            processed += 1
             print(f"Processing page {p['id']}")
             output = self.openai_query(client, gpt_prompt_segments, p['text'], key=p['key'])
             gpt_parsed = self.parse_gpt_output(output)
@@ -243,7 +225,7 @@ class FullKG(BaseImporter):
                     f"Storing {len(gpt_parsed['entities'])} entities and {len(gpt_parsed['relations'])} relations from page {p['id']} to Neo4j")
                 self.store_to_neo4j(p['id'], gpt_parsed['entities'], gpt_parsed['relations'], run)
 
-        print(f"\n=== Finished processing {len(pages)} pages, {len(failed_pages)} pages had output format issue")
+        print(f"\n=== Finished processing {processed} pages, {len(failed_pages)} pages had output format issue")
         if len(failed_pages) == 0:
             return
 
@@ -289,9 +271,9 @@ class FullKG(BaseImporter):
 
         with self._driver.session(database=self._database) as session:
             print("Normalising Person names")
-            session.run(QUERY_NORM_PERSONS, remove_titles=REMOVE_TITLES)
+            session.run(self.named("normalize persons", QUERY_NORM_PERSONS), remove_titles=REMOVE_TITLES)
             print("Normalising Occupations")
-            session.run(QUERY_NORM_OCCUPATIONS)
+            session.run(self.named("normalize occupations", QUERY_NORM_OCCUPATIONS))
 
     def resolve_entities(self):
         ### ER of Persons
@@ -316,8 +298,8 @@ class FullKG(BaseImporter):
 
         print("Resolving Persons - same and previous page")
         with self._driver.session(database=self._database) as session:
-            session.run(QUERY_RESOLVE_SAME_PAGE)
-            session.run(QUERY_RESOLVE_PREVIOUS_PAGE)
+            session.run(self.named("resolve persons same page", QUERY_RESOLVE_SAME_PAGE))
+            session.run(self.named("resolve persons previous page", QUERY_RESOLVE_PREVIOUS_PAGE))
 
         # leverage outputs of RE, examples:
         #   - "I. B. Conant" (page 79) - WORKS_FOR -> "Harvard University" <- WORKS_FOR - "Conant" (page 52)
@@ -337,8 +319,8 @@ class FullKG(BaseImporter):
         """
 
         with self._driver.session(database=self._database) as session:
-            session.run(QUERY_SIMILAR_OCC)
-            session.run(QUERY_SIMILAR_ORG)
+            session.run(self.named("similar occupation entities", QUERY_SIMILAR_OCC))
+            session.run(self.named("similar organization entities", QUERY_SIMILAR_ORG))
 
         # Prepare for resolution of surnames - the same surname alone is not enough to resolve, we need additional evidence
         QUERY_RESOLVE_PER_SURNAMES = """
@@ -390,13 +372,13 @@ class FullKG(BaseImporter):
 
         print("Resolving person names based on string similarity")
         with self._driver.session(database=self._database) as session:
-            session.run(QUERY_RESOLVE_PER_SURNAMES)
-            session.run(QUERY_RESOLVE_PER_SIM)
+            session.run(self.named("resolve person surnames", QUERY_RESOLVE_PER_SURNAMES))
+            session.run(self.named("similar persons", QUERY_RESOLVE_PER_SIM))
             session.run(QUERY_PER_SIM_GRAPH)
             session.run(
                 "CALL gds.wcc.write('graph', { writeProperty: 'resolution_wcc' }) YIELD nodePropertiesWritten, componentCount")
             session.run("CALL gds.graph.drop('graph') YIELD graphName")
-            session.run(QUERY_RESOLVE_PER)
+            session.run(self.named("resolve persons by component", QUERY_RESOLVE_PER))
 
     def create_kg(self):
         # Reset the KG
@@ -406,7 +388,7 @@ class FullKG(BaseImporter):
         """
         print("Cleansing the KG")
         with self._driver.session(database=self._database) as session:
-            session.run(QUERY_DELETE_KG)
+            session.run(self.named("delete kg", QUERY_DELETE_KG))
 
         RENAME_ENTS = {'Technology': 'Occupation'}
         RENAME_RELS = {'TALKED_TO': 'TALKED_WITH',
@@ -463,7 +445,8 @@ class FullKG(BaseImporter):
 
         print("Creating the KG ...")
         with self._driver.session(database=self._database) as session:
-            res = session.run(QUERY_CREATE_KG, rename_ents=RENAME_ENTS, rename_rels=RENAME_RELS, schema=SCHEMA)
+            res = session.run(self.named("create kg", QUERY_CREATE_KG), rename_ents=RENAME_ENTS, rename_rels=RENAME_RELS,
+                              schema=SCHEMA)
             print(f"Created {res.data()[0]['n_rels']} KG relations")
 
         # create similarities
@@ -481,9 +464,9 @@ class FullKG(BaseImporter):
 
         with self._driver.session(database=self._database) as session:
             print("Creating Organization similarities")
-            session.run(QUERY_SIM_ORG)
+            session.run(self.named("similar organizations", QUERY_SIM_ORG))
             print("Creating Occupation similarities")
-            session.run(QUERY_SIM_OCC)
+            session.run(self.named("similar occupations", QUERY_SIM_OCC))
 
     def run_gds(self):
         QUERY_GRAPH_PROJECTION = """
@@ -1,6 +1,7 @@
 import sys
 
 from util.base_importer import BaseImporter
+from util.keyset_reader import KeysetReader
 
 
 class CoOccurrenceGenerator(BaseImporter):
@@ -8,7 +9,7 @@ class CoOccurrenceGenerator(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self._database = "ned"
-        self.batch_size = 50
+        self.adaptive_batch_size = True
 
     def get_page_count(self):
         with self._driver.session(database=self._database) as session:
@@ -16,18 +17,16 @@ class CoOccurrenceGenerator(BaseImporter):
     
     def get_medical_entities_by_sentence(self):
         medical_entities_query = """
-        MATCH (p:Page:NEDProcessed)-[r:MENTIONS_ENTITY]->(me:MedicalEntity)
-        WITH p, r.sentence_index as sentences, me 
+        MATCH (n)-[r:MENTIONS_ENTITY]->(me:MedicalEntity)
+        WITH n, r.sentence_index as sentences, me 
         UNWIND sentences as sentence
-        WITH p, sentence, collect(distinct me.id) as entities
+        WITH n, sentence, collect(distinct me.id) as entities
         UNWIND range(0, size(entities)-2) as i
         UNWIND range(i+1, size(entities)-1) as j
-        RETURN p.id as p, sentence, entities, i, j
+        RETURN n.id as p, sentence, entities, i, j
         """
-        with self._driver.session(database=self._database) as session:
-            result = session.run(query=medical_entities_query)
-            for record in iter(result):
-                yield dict(record)
+        # every page yields a pair of entities per sentence: few pages at a time
+        return KeysetReader(self, "Page", "id", where="n:NEDProcessed", query=medical_entities_query, fetch_size=100)
 
     def link_cooccurring_entities(self):
         link_entities = """
@@ -1,10 +1,9 @@
 import sys
 from pathlib import Path
 
-import neo4j.exceptions
-
-from chapters.ch08.disambiguation.entity_extractor import EntityExtractor
+from chapters.ch09.disambiguation.entity_extractor import EntityExtractor
 from util.base_importer import BaseImporter
+from util.keyset_reader import KeysetReader
 
 
 class Disambiguator(BaseImporter):
@@ -12,28 +11,46 @@ class Disambiguator(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self._database = "ned"
+        # the pages are read by id (see get_pages): the index PageId of the databases imported before is replaced
+        # by a uniqueness constraint
+        self.schema = ["DROP INDEX PageId IF EXISTS",
+                       "CREATE CONSTRAINT page_id_unique IF NOT EXISTS FOR (n:Page) REQUIRE n.id IS UNIQUE",
+                       "CREATE CONSTRAINT IF NOT EXISTS FOR (n:MedicalEntity) REQUIRE n.id IS UNIQUE",
+                       "CREATE INDEX medicalEntityName IF NOT EXISTS FOR (n:MedicalEntity) ON (n.name)",
+                       "CREATE INDEX EntityMentionNormalizedName IF NOT EXISTS FOR (n:EntityMention) ON (n.name_normalized)",
+                       "CREATE FULLTEXT INDEX medicalEntityText IF NOT EXISTS FOR (n:MedicalEntity) ON EACH [n.name, n.type]",
+                       "CREATE FULLTEXT INDEX entityName IF NOT EXISTS FOR (n:EntityMention) ON EACH [n.name]"]
+        # every row is a whole page with its entities: start small and let the batch size adapt, within
+        # max_batch_bytes
         self.batch_size = 50
-        self.entity_extractor: EntityExtractor = None
+        self.adaptive_batch_size = True
+        self.metathesaurus_file = None
+        # every worker process loads its own scispacy model and UMLS linker knowledge base, that take a few GB
+        self.processes = min(self.processes, 2)
 
     def setupEntityExtractor(self, metathesaurus_file):
-        self.entity_extractor = EntityExtractor(metathesaurus_file)
+        # the EntityExtractor is loaded by each worker process of the pipeline
+        self.metathesaurus_file = metathesaurus_file
 
     def get_page_count(self):
         with self._driver.session(database=self._database) as session:
             return session.run("MATCH (p:Page) WHERE not (p:NEDProcessed) RETURN count(p) as pages").single()["pages"]
 
+    def get_pages(self):
+        # paged by id: the pages are marked NEDProcessed by the writes while they are read
+        return KeysetReader(self, "Page", "id", where="NOT n:NEDProcessed", query="RETURN n.id as id, n.text as text")
+
+    @staticmethod
+    def extract_page(entity_extractor: EntityExtractor, page: dict):
+        return {
+            "id": page["id"],
+            "ents": entity_extractor.extract_ents(page["text"])
+        }
+
     def get_entities_by_page(self):
-        pages_query = """
-        MATCH (p:Page) 
-        WHERE not (p:NEDProcessed)
-        RETURN p.id as id, p.text as text"""
-        with self._driver.session(database=self._database) as session:
-            result = session.run(query=pages_query)
-            for page in iter(result):
-                yield {
-                    "id": page["id"],
-                    "ents": self.entity_extractor.extract_ents(page["text"])
-                }
+        # scispacy and the UMLS linker run in worker processes while the pages already processed are written
+        return self.pipeline(self.get_pages(), self.extract_page, setup=EntityExtractor,
+                             setup_args=(self.metathesaurus_file,), ordered=False)
 
     def ingest_entities(self):
         upload_ents_query = """
@@ -82,24 +99,11 @@ class Disambiguator(BaseImporter):
         """
 
         size = self.get_page_count()
-        self.batch_store(upload_ents_query, self.get_entities_by_page(), size=size)
-
-    def set_constraints(self):
-        queries = ["CREATE CONSTRAINT IF NOT EXISTS FOR (n:MedicalEntity) REQUIRE n.id IS UNIQUE",
-                   "CREATE INDEX medicalEntityName IF NOT EXISTS FOR (n:MedicalEntity) ON (n.name)",
-                   "CREATE INDEX EntityMentionNormalizedName IF NOT EXISTS FOR (n:EntityMention) ON (n.name_normalized)",
-                   "CREATE FULLTEXT INDEX medicalEntityText FOR (n:MedicalEntity) ON EACH [n.name, n.type]",
-                   "CREATE FULLTEXT INDEX entityName FOR (n:EntityMention) ON EACH [n.name]"]
-
-        for q in queries:
-            with self._driver.session(database=self._database) as session:
-                try:
-                    session.run(q)
-                except neo4j.exceptions.ClientError as e:
-                    if e.code == 'Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists':
-                        print("skipping", q)
-                    else:
-                        raise e
+        # the entities are spooled before being written: when the writes fail the next run does not extract them
+        # again, and the spool is dropped once they are all in, as new pages may be imported later
+        pages = self.spooled("entities_by_page", self.get_entities_by_page(), size=size, desc="extracting entities")
+        self.batch_store(upload_ents_query, pages, size=len(pages), checkpoint=pages.directory)
+        pages.clear()
 
 
 if __name__ == '__main__':
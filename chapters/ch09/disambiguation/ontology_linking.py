@@ -1,5 +1,6 @@
 import sys
 from util.base_importer import BaseImporter
+from util.keyset_reader import KeysetReader
 
 
 class OntologyLinking(BaseImporter):
@@ -7,7 +8,7 @@ class OntologyLinking(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self._database = "ned"
-        self.batch_size = 50
+        self.adaptive_batch_size = True
 
     def get_medical_entities(self):
         with self._driver.session(database=self._database) as session:
@@ -21,17 +22,13 @@ class OntologyLinking(BaseImporter):
 
     def get_medical_links(self):
         medical_links_query = """
-        MATCH (me:MedicalEntity)
-        MATCH (umls:UMLS {id: me.id})
+        MATCH (umls:UMLS {id: n.id})
         OPTIONAL MATCH (umls)-[:UMLS_TO_SNOMED]->(snomed:SnomedEntity)
         OPTIONAL MATCH (umls)-[:UMLS_TO_HPO]->(hpo:Hpo)
         OPTIONAL MATCH (umls)-[:UMLS_TO_DIS]->(dis:Disease)
-        RETURN me.id AS me, umls.id AS umls, snomed.id As snomed, hpo.id AS hpo, dis.id AS dis
+        RETURN n.id AS me, umls.id AS umls, snomed.id As snomed, hpo.id AS hpo, dis.id AS dis
         """
-        with self._driver.session(database=self._database) as session:
-            result = session.run(query=medical_links_query)
-            for record in iter(result):
-                yield dict(record)
+        return KeysetReader(self, "MedicalEntity", "id", query=medical_links_query)
 
     def link_entities_to_snomed(self):
         link_entities = """
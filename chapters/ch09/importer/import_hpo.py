@@ -1,8 +1,6 @@
 import sys
 import logging
 
-from neo4j.exceptions import ClientError as Neo4jClientError
-
 from util.base_importer import BaseImporter
 
 logging.basicConfig(
@@ -17,24 +15,14 @@ class HPOImporter(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self._database = "ned"
+        # TODO: must be updated in the book
+        self.schema = ["CREATE CONSTRAINT n10s_unique_uri IF NOT EXISTS FOR (r:Resource) REQUIRE r.uri IS UNIQUE",
+                       "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Resource) REQUIRE (n.id, n.uri) IS UNIQUE",
+                       "CREATE INDEX disease_id IF NOT EXISTS FOR (n:Disease) ON (n.id)",
+                       "CREATE INDEX hpo_id IF NOT EXISTS FOR (n:Hpo) ON (n.id)"]
         with self._driver.session() as session:
             session.run(f"CREATE DATABASE {self._database} IF NOT EXISTS")
 
-    def set_constraints(self):
-        # TODO: must be updated in the book
-        queries = ["CREATE CONSTRAINT n10s_unique_uri FOR (r:Resource) REQUIRE r.uri IS UNIQUE;",
-                   "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Resource) REQUIRE (n.id, n.uri) IS UNIQUE;",
-                   "CREATE INDEX disease_id FOR (n:Disease) ON (n.id);",
-                   "CREATE INDEX hpo_id FOR (n:Hpo) ON (n.id);"]
-        with self._driver.session(database=self._database) as session:
-            for q in queries:
-                try:
-                    session.run(q)
-                except Neo4jClientError as e:
-                    # ignore if we already have the rule in place
-                    if e.code != "Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists":
-                        raise e
-
     def check_neo_semantics(self):
         query = 'SHOW PROCEDURES YIELD name WHERE name ="n10s.graphconfig.init"'
         with self._driver.session(database=self._database) as session:
@@ -10,16 +10,14 @@ class OcredDocumentsImport(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self._database = "ned"
+        # Page.id is unique, the disambiguation steps page through Page by id: the index PageId of the databases
+        # imported before is replaced by the uniqueness constraint
+        self.schema = ["DROP INDEX PageId IF EXISTS",
+                       "CREATE CONSTRAINT page_id_unique IF NOT EXISTS FOR (n:Page) REQUIRE n.id IS UNIQUE",
+                       "CREATE INDEX FileId IF NOT EXISTS FOR (n:File) ON (n.id)",
+                       "CREATE FULLTEXT INDEX PageText IF NOT EXISTS FOR (n:Page) ON EACH [n.text]"]
         self._size = None
-
-    def set_constraints(self):
-        queries = ["CREATE INDEX PageId IF NOT EXISTS FOR (n:Page) ON (n.id)",
-                   "CREATE INDEX FileId IF NOT EXISTS FOR (n:File) ON (n.id)",
-                   "CREATE FULLTEXT INDEX PageText IF NOT EXISTS FOR (n:Page) ON EACH [n.text]"]
-
-        for q in queries:
-            with self._driver.session(database=self._database) as session:
-                session.run(q)
+        self.adaptive_batch_size = True
 
     @staticmethod
     def get_page_count(base_path):
@@ -10,30 +10,19 @@ class UmlsConceptMappingsImporter(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self._database = "ned"
-        self._size = None
+        self.schema = ["CREATE CONSTRAINT IF NOT EXISTS FOR (n:UMLS) REQUIRE n.id IS UNIQUE"]
 
-    def set_constraints(self):
-        queries = ["CREATE CONSTRAINT IF NOT EXISTS FOR (n:UMLS) REQUIRE n.id IS UNIQUE"]
-
-        for q in queries:
-            with self._driver.session(database=self._database) as session:
-                session.run(q)
-
-    def get_csv_size(self, umls_file, encoding="utf-8"):
-        if self._size is None:
-            self._size = sum(1 for row in UmlsConceptMappingsImporter.get_rows(umls_file))
-        return self._size
+    def get_rows(self, umls_file):
+        return self.split_rows(umls_file, self.parse_rows)
 
     @staticmethod
-    def get_rows(umls_file):
-        with open(umls_file, "r+") as in_file:
-            reader = csv.reader(in_file, delimiter="|")
-            for row in reader:
-                yield {
-                    "umls_id": row[0],
-                    "type_source": row[11],
-                    "other_id": row[13]
-                }
+    def parse_rows(lines):
+        for row in csv.reader(lines, delimiter="|"):
+            yield {
+                "umls_id": row[0],
+                "type_source": row[11],
+                "other_id": row[13]
+            }
 
     def import_umls_snomed(self, umls_file):
         umls_snomed_query = """
@@ -48,8 +37,7 @@ class UmlsConceptMappingsImporter(BaseImporter):
                 ELSE coalesce(se.umls_ids,[]) + item.umls_id END
         """
 
-        size = self.get_csv_size(umls_file)
-        self.batch_store(umls_snomed_query, self.get_rows(umls_file), size=size)
+        self.batch_store(umls_snomed_query, self.get_rows(umls_file), checkpoint=umls_file, columnar=True)
 
     def import_umls_hpo(self, umls_file):
         umls_hpo_query = """
@@ -63,8 +51,7 @@ class UmlsConceptMappingsImporter(BaseImporter):
                 WHEN item.umls_id in hpo.umls_ids THEN hpo.umls_ids
                 ELSE coalesce(hpo.umls_ids,[]) + item.umls_id END
         """
-        size = self.get_csv_size(umls_file)
-        self.batch_store(umls_hpo_query, self.get_rows(umls_file), size=size)
+        self.batch_store(umls_hpo_query, self.get_rows(umls_file), checkpoint=umls_file, columnar=True)
 
     def import_umls_disease(self, umls_file):
         umls_hpo_query = """
@@ -78,8 +65,7 @@ class UmlsConceptMappingsImporter(BaseImporter):
                 WHEN item.umls_id in dis.umls_ids THEN dis.umls_ids
                 ELSE coalesce(dis.umls_ids,[]) + item.umls_id END
         """
-        size = self.get_csv_size(umls_file)
-        self.batch_store(umls_hpo_query, self.get_rows(umls_file), size=size)
+        self.batch_store(umls_hpo_query, self.get_rows(umls_file), checkpoint=umls_file, columnar=True)
 
 
 if __name__ == '__main__':
@@ -96,7 +82,7 @@ if __name__ == '__main__':
         print(base_path, "isn't a directory")
         sys.exit(1)
 
-    umls_path = base_path / "MRCONSO.RRF"
+    umls_path = importing.find_input(base_path / "MRCONSO.RRF")
 
     if not umls_path.is_file():
         print(umls_path, "doesn't exist in ", base_path)
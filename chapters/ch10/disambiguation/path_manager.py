@@ -48,7 +48,7 @@ class PathExtraction():
       ORDER BY degree DESC
       LIMIT 350
       WITH collect(name) as hub_nodes
-      MATCH (s1), (s2)
+      MATCH (s1:SnomedEntity), (s2:SnomedEntity)
       WHERE s1.id="{s1_id}" AND
             s2.id="{s2_id}"
       WITH s1, s2, allShortestPaths((s1)-[:SNOMED_RELATION*1..2]-(s2)) AS paths, hub_nodes
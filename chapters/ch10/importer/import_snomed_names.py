@@ -3,6 +3,7 @@ import sys
 from pathlib import Path
 
 from util.base_importer import BaseImporter
+from util.line_index import first_line
 
 
 class SnomedNamesImporter(BaseImporter):
@@ -10,23 +11,20 @@ class SnomedNamesImporter(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self._database = "ned-llm"
-        self.batch_size = 100
+        self.adaptive_batch_size = True
         with self._driver.session() as session:
             session.run(f"CREATE DATABASE `{self._database}` IF NOT EXISTS")
 
-    @staticmethod
-    def get_csv_size(snomedNames_file, encoding="utf-8"):
-        return sum(1 for row in SnomedNamesImporter.get_rows(snomedNames_file))
+    def get_rows(self, snomedNames_file):
+        header = next(csv.reader([first_line(snomedNames_file)], delimiter="\t"))
+        return self.split_rows(snomedNames_file, self.parse_rows, (header,), skip=1)
 
     @staticmethod
-    def get_rows(snomedNames_file):
-        with open(snomedNames_file, "r+") as in_file:
-            reader = csv.reader(in_file, delimiter="\t")
-            header = next(reader)
-            for row in reader:
-                record = dict(zip(header, row))
-                record["termAsType"] = record["term"].replace(" ", "_").upper()
-                yield record
+    def parse_rows(lines, header):
+        for row in csv.reader(lines, delimiter="\t"):
+            record = dict(zip(header, row))
+            record["termAsType"] = record["term"].replace(" ", "_").upper()
+            yield record
 
     def import_snomed_names(self, snomedNames_file):
         snomed_names_concepts_query = """
@@ -49,9 +47,8 @@ class SnomedNamesImporter(BaseImporter):
                 WHEN item.term in e.aliases THEN  e.aliases
                 ELSE coalesce(e.aliases, []) + item.term END
         """
-        size = self.get_csv_size(snomedNames_file)
-        self.batch_store(snomed_names_concepts_query, self.get_rows(snomedNames_file), size=size)
-        self.batch_store(snomed_names_entities_query, self.get_rows(snomedNames_file), size=size)
+        self.batch_store(snomed_names_concepts_query, self.get_rows(snomedNames_file), checkpoint=snomedNames_file)
+        self.batch_store(snomed_names_entities_query, self.get_rows(snomedNames_file), checkpoint=snomedNames_file)
 
 
 def csv_as_dict_list(path):
@@ -74,7 +71,7 @@ if __name__ == '__main__':
         print(base_path, "isn't a directory")
         sys.exit(1)
 
-    snomedNames_dat = base_path / "sct2_Description_Full-en_US1000124_20220901.txt"
+    snomedNames_dat = importing.find_input(base_path / "sct2_Description_Full-en_US1000124_20220901.txt")
 
     if not snomedNames_dat.is_file():
         print(snomedNames_dat, "doesn't exist in ", base_path)
@@ -84,7 +81,7 @@ if __name__ == '__main__':
     importing.import_snomed_names(snomedNames_dat)
     importing.close()
 
-    snomedDefs_dat = base_path / "sct2_TextDefinition_Full-en_US1000124_20220901.txt"
+    snomedDefs_dat = importing.find_input(base_path / "sct2_TextDefinition_Full-en_US1000124_20220901.txt")
 
     if not snomedDefs_dat.is_file():
         print(snomedDefs_dat, "doesn't exist in ", base_path)
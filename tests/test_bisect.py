@@ -0,0 +1,60 @@
+import json
+import threading
+
+import pytest
+from neo4j.exceptions import ClientError
+
+from util.base_importer import BaseImporter
+from util.metrics import ImportMetrics
+
+
+class SemanticError(ClientError):
+    code = "Neo.ClientError.Statement.SemanticError"
+
+
+class ProcedureNotFound(ClientError):
+    code = "Neo.ClientError.Procedure.ProcedureNotFound"
+
+
+def importer(tmp_path):
+    importing = BaseImporter.__new__(BaseImporter)
+    importing.bisect_failures = True
+    importing.dead_letter_dir = str(tmp_path)
+    importing._dead_letter_lock = threading.Lock()
+    importing._incremental = None
+    importing.metrics = ImportMetrics("BaseImporter")
+    return importing
+
+
+def writer(bad: set, error=SemanticError):
+    written, calls = [], []
+
+    def write(rows):
+        calls.append(len(rows))
+        if any(row in bad for row in rows):
+            raise error("boom")
+        written.extend(rows)
+    return write, written, calls
+
+
+def test_adjacent_poison_rows_are_dead_lettered(tmp_path):
+    write, written, _ = writer({40, 41, 42, 43})
+    failures = importer(tmp_path).isolate_failures(write, "query", list(range(100)))
+    assert [row for row, _ in failures] == [40, 41, 42, 43]
+    assert sorted(written) == [row for row in range(100) if row not in {40, 41, 42, 43}]
+    with (tmp_path / "BaseImporter.jsonl").open() as f:
+        assert [json.loads(line)["row"] for line in f] == [40, 41, 42, 43]
+
+
+def test_batch_failing_on_every_row_raises(tmp_path):
+    write, written, _ = writer(set(range(8)))
+    with pytest.raises(SemanticError):
+        importer(tmp_path).isolate_failures(write, "query", list(range(8)))
+    assert written == []
+
+
+def test_query_errors_are_not_bisected(tmp_path):
+    write, _, calls = writer({3}, ProcedureNotFound)
+    with pytest.raises(ProcedureNotFound):
+        importer(tmp_path).isolate_failures(write, "query", list(range(8)))
+    assert calls == [8]
@@ -0,0 +1,79 @@
+from util.preflight import explain, index_seeks, scanned_label
+
+
+def operator(operator_type, details, identifiers, children=(), **args):
+    # the shape of `result.consume().plan` over Bolt (neo4j 5): the arguments are sent as "args"
+    return {"operatorType": f"{operator_type}@neo4j", "identifiers": identifiers,
+            "args": {"Details": details, "EstimatedRows": 1.0, "PipelineInfo": "Fused in Pipeline 0", **args},
+            "children": list(children)}
+
+
+def plan(child):
+    return operator("ProduceResults", "", [], [operator("EmptyResult", "", [], [child])],
+                    planner="COST", runtime="PIPELINED", version="5", **{"planner-impl": "IDP"})
+
+
+SEEKS = plan(operator("Apply", "", ["item", "s", "e"], [
+    operator("Unwind", "$batch AS item", ["item"]),
+    operator("CartesianProduct", "", ["item", "s", "e"], [
+        operator("NodeUniqueIndexSeek", "UNIQUE s:SnomedEntity(id) WHERE id = item.start", ["item", "s"]),
+        operator("NodeUniqueIndexSeek", "UNIQUE e:SnomedEntity(id) WHERE id = item.end", ["item", "e"]),
+    ]),
+]))
+
+SCAN = plan(operator("CartesianProduct", "", ["m", "d"], [
+    operator("NodeIndexSeek", "RANGE INDEX m:MiRNA(name) WHERE name = $name", ["m"]),
+    operator("NodeByLabelScan", "d:Disease", ["d"]),
+]))
+
+
+class Result:
+    def __init__(self, plan=None, count=None):
+        self.plan = plan
+        self.count = count
+
+    def consume(self):
+        return self
+
+    def single(self):
+        return {"count": self.count}
+
+
+class Session:
+    def __init__(self, plan, counts):
+        self.plan = plan
+        self.counts = counts
+        self.queries = []
+
+    def run(self, query, parameters=None):
+        self.queries.append(query)
+        if query.startswith("EXPLAIN"):
+            return Result(plan=self.plan)
+        return Result(count=next(count for label, count in self.counts.items() if f":`{label}`" in query))
+
+
+def test_scanned_label_reads_bolt_args():
+    assert scanned_label(operator("NodeByLabelScan", "d:Disease", ["d"])) == "Disease"
+
+
+def test_index_seeks():
+    assert index_seeks(SEEKS) == {("SnomedEntity", ("id",))}
+
+
+def test_cartesian_product_of_index_seeks_is_fine():
+    problems, _ = explain(Session(SEEKS, {}), "query", {})
+    assert problems == []
+
+
+def test_large_label_scan_and_its_cartesian_product():
+    session = Session(SCAN, {"Disease": 200000})
+    problems, seeks = explain(session, "query", {}, large_label=100000)
+    assert problems == ["CartesianProduct", "NodeByLabelScan on Disease (200000 nodes): d:Disease"]
+    assert seeks == {("MiRNA", ("name",))}
+    # the label is counted once
+    assert len(session.queries) == 2
+
+
+def test_small_label_scan_is_fine():
+    problems, _ = explain(Session(SCAN, {"Disease": 10}), "query", {}, large_label=100000)
+    assert problems == []
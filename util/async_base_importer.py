@@ -0,0 +1,179 @@
+import asyncio
+import time
+from typing import Iterable
+
+from util.base_importer import BaseImporter, ImportProgress
+from util.driver_registry import drivers
+from util.graphdb_base import GraphDBBase
+from util.metrics import counters_dict
+from util.payload import payload_size
+
+try:
+    from neo4j import AsyncGraphDatabase
+except ImportError:  # the asyncio driver is available since neo4j 5
+    AsyncGraphDatabase = None
+
+
+def get_async_driver(uri, auth, config: dict):
+    if AsyncGraphDatabase is None:
+        raise RuntimeError("The asyncio driver requires neo4j>=5, please upgrade the neo4j package")
+    return AsyncGraphDatabase.driver(uri, auth=auth, **config)
+
+
+async def run_write(session, query: str, parameters: dict):
+    async def work(tx):
+        result = await tx.run(query, parameters)
+        return counters_dict((await result.consume()).counters)
+
+    return await session.execute_write(work)
+
+
+async def bisect(importer: BaseImporter, session, query: str, batch: list, counters: list, sent: list):
+    """
+    Asyncio counterpart of BaseImporter.bisect, the counters of the transactions are appended to counters
+    and the size of the parameters they sent to sent
+    """
+    try:
+        parameters = importer.batch_parameters(batch)
+        sent.append(payload_size(parameters))
+        counters.append(await run_write(session, query, parameters))
+        return []
+    except Exception as e:
+        if not importer.bisect_failures or not importer.is_row_error(e):
+            raise
+        if len(batch) == 1:
+            return [(batch[0], e)]
+    middle = len(batch) // 2
+    return (await bisect(importer, session, query, batch[:middle], counters, sent) +
+            await bisect(importer, session, query, batch[middle:], counters, sent))
+
+
+async def write_batch(importer: BaseImporter, session, query: str, batch: list):
+    """Asyncio counterpart of BaseImporter.write_batch"""
+    start = time.perf_counter()
+    counters, sent = [], []
+    failures = await bisect(importer, session, query, batch, counters, sent)
+    if failures:
+        if len(failures) == len(batch) > 1:
+            raise failures[0][1]
+        importer.dead_letter(query, failures)
+    importer.record_batch(query, batch, time.perf_counter() - start, counters, len(failures), sum(sent))
+
+
+async def pipelined_store(importer: BaseImporter, driver, query: str, batches: Iterable, progress: ImportProgress):
+    """
+    Write batches keeping up to `importer.max_in_flight` of them in flight, each one on its own session
+      The batches are produced in a worker thread, so that building the next batches (parsing, NLP, ...)
+      overlaps with the writes of the previous ones instead of waiting for each round trip.
+    :param importer: the importer settings (database, max_in_flight, ...) apply to the writes
+    :param driver: an AsyncDriver
+    :param query: the parametrized insertion query, starting with `UNWIND $batch as item`
+    :param batches: an iterator of lists of parameters
+    :param progress: the ImportProgress to update
+    """
+    loop = asyncio.get_running_loop()
+    max_in_flight = max(1, importer.max_in_flight)
+    pending = asyncio.Queue(maxsize=max_in_flight)
+    batches = iter(batches)
+    errors = []
+
+    async def write():
+        session = None
+        while True:
+            batch = await pending.get()
+            if batch is None:
+                break
+            if errors:
+                # keep draining so that the producer is never blocked by a failed writer
+                continue
+            try:
+                if session is None:
+                    session = driver.session(database=importer._database)
+                await write_batch(importer, session, query, batch)
+                progress.update(len(batch))
+            except Exception as e:
+                errors.append(e)
+        if session is not None:
+            await session.close()
+
+    writers = [asyncio.create_task(write()) for _ in range(max_in_flight)]
+    try:
+        while not errors:
+            batch = await loop.run_in_executor(None, next, batches, None)
+            if batch is None:
+                break
+            await pending.put(batch)
+    finally:
+        for _ in writers:
+            await pending.put(None)
+        await asyncio.gather(*writers)
+        progress.close()
+
+    if errors:
+        raise errors[0]
+
+
+class AsyncGraphDBBase(GraphDBBase):
+    """
+    GraphDBBase on top of the asyncio driver: `self._driver` is an AsyncDriver,
+    so its sessions must be used with `async with` and close() must be awaited
+    """
+
+    def create_driver(self, uri, auth, config: dict):
+        return get_async_driver(uri, auth, config)
+
+    async def close(self):
+        await self._driver.close()
+
+    async def execute_without_exception(self, query: str):
+        try:
+            async with self.get_session() as session:
+                await session.run(query)
+        except Exception as e:
+            pass
+
+    async def executeNoException(self, session, query: str):
+        try:
+            await session.run(query)
+        except Exception as e:
+            pass
+
+
+class AsyncBaseImporter(AsyncGraphDBBase, BaseImporter):
+    """
+    BaseImporter whose batch_store is a coroutine pipelining up to `self.max_in_flight` batches
+      Queries and parameters iterators are the same used with BaseImporter.batch_store, e.g.
+        await importer.batch_store(query, importer.get_rows(file))
+      The schema and preflight queries run before the writes on a synchronous driver to the same server.
+    """
+    _setup_driver = None
+
+    async def batch_store(self, query: str, parameters_iterator: Iterable, size: int = None, desc="",
+                          checkpoint=None, dedup: dict = None, columnar: bool = False, fingerprint=None):
+        """
+        Ingest data in batches keeping several of them in flight
+        :param query: the parametrized insertion query, starting with `UNWIND $batch as item`
+        :param parameters_iterator: an iterator of the data to ingest as parameters for query
+        :param size: optional parameters_iterator's length
+        :param desc: optional progress bar description
+        :param checkpoint: optional input file or directory, to resume, as for BaseImporter.batch_store
+        :param dedup: optional node keys to send deduplicated next to the batch, as for BaseImporter.batch_store
+        :param columnar: send the batches as parallel lists, as for BaseImporter.batch_store
+        :param fingerprint: optional natural key of the rows for incremental runs, as for BaseImporter.batch_store
+        """
+        with self.batch_run(query, parameters_iterator, size, desc, checkpoint, dedup, columnar,
+                            fingerprint) as (query, rows, size):
+            await pipelined_store(self, self._driver, query, self.iter_batches(rows), self.get_progress(size, desc))
+
+    def setup_session(self):
+        if self._setup_driver is None:
+            uri, auth, config = self._connection
+            self._setup_driver = drivers.acquire(uri, auth, config, self.database)
+        return self._setup_driver.session(database=self._database)
+
+    async def close(self):
+        self.save_reports()
+        if self._setup_driver is not None:
+            self._setup_driver.close()
+            self._setup_driver = None
+        await super().close()
@@ -1,34 +1,402 @@
-import math
-from itertools import islice
-from typing import Iterable
+import asyncio
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from itertools import chain, islice
+from pathlib import Path
+from typing import Callable, Iterable
 
+from neo4j.exceptions import AuthError, ClientError, CypherSyntaxError, Forbidden
+from util.bulk_export import BulkExporter
+from util.checkpoint import Checkpoint, CheckpointJournal, default_checkpoint_dir
+from util.decompress import DecompressingReader, compression
+from util.fingerprints import FingerprintStore, IncrementalRun, row_hash
 from util.graphdb_base import GraphDBBase
+from util.line_index import LineIndex, RangeProgress, parse_range, range_parser
+from util.metrics import ImportMetrics, counters_dict
+from util.payload import ColumnarRows, columnar_query, payload_size, to_columns
+from util.pipeline import process_map
+from util.preflight import explain
+from util.schema import schema_registry
+from util.spool import Spool
 from tqdm import tqdm
 
+# the client errors of the query itself, that no row of the batch can cause
+QUERY_ERRORS = ("Neo.ClientError.Procedure.", "Neo.ClientError.Statement.ParameterMissing")
+
+
+class ImportProgress:
+    """
+    Progress bar of a batch_store run
+      When the size of the input is known progress is counted in rows, otherwise it is measured in bytes
+      read from the files opened through BaseImporter.open_input, so that the input never has to be read
+      twice just to count it. Without such files only the number of ingested rows is shown.
+    """
+
+    def __init__(self, inputs: list, size: int = None, desc=""):
+        self._inputs = inputs
+        self._size = size
+        self._desc = desc
+        self._bar = None
+        self._lock = threading.Lock()
+        self.rows = 0
+
+    def bytes_read(self):
+        return sum(total if raw.closed else raw.tell() for raw, total in self._inputs)
+
+    def update(self, rows: int):
+        with self._lock:
+            self.rows += rows
+            if self._bar is None:
+                # created lazily: the input files are opened only once the generator starts producing rows
+                if self._size is None and self._inputs:
+                    self._bar = tqdm(unit="B", unit_scale=True, unit_divisor=1024, desc=self._desc)
+                else:
+                    self._bar = tqdm(total=self._size, unit="rows", desc=self._desc)
+            if self._bar.unit == "B":
+                self._bar.total = sum(total for _, total in self._inputs)
+                self._bar.set_postfix(rows=str(self.rows), refresh=False)
+                self._bar.update(self.bytes_read() - self._bar.n)
+            else:
+                self._bar.update(rows)
+
+    def close(self):
+        if self._bar is not None:
+            self._bar.close()
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size controller driven by the measured commit latency and the serialized size of the parameters
+      After every commit the batch grows (up to twice) when it was faster than target_latency and shrinks
+      (down to half) when it was slower. Batches are also cut as soon as their payload reaches max_bytes,
+      so the same settings work for three short strings per row as well as for whole documents.
+    """
+
+    def __init__(self, initial_size=1000, min_size=1, max_size=20000, max_bytes=8 * 1024 * 1024,
+                 target_latency=1.0):
+        self.size = initial_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self._lock = threading.Lock()
+
+    def batches(self, parameters_iterator: Iterable):
+        batch, batch_bytes = [], 0
+        for parameters in parameters_iterator:
+            batch.append(parameters)
+            batch_bytes += payload_size(parameters)
+            if len(batch) >= self.size or batch_bytes >= self.max_bytes:
+                yield batch
+                batch, batch_bytes = [], 0
+        if batch:
+            yield batch
+
+    def record(self, rows: int, latency: float):
+        factor = 2.0 if latency <= 0 else min(2.0, max(0.5, self.target_latency / latency))
+        with self._lock:
+            self.size = int(min(self.max_size, max(self.min_size, rows * factor)))
+
 
 class BaseImporter(GraphDBBase):
     def __init__(self, command=None, argv=None, extended_options='', extended_long_options=None):
         super().__init__(command, argv, extended_options, extended_long_options)
         self._database = "neo4j"
         self.batch_size = 1000
+        self.workers = 4
+        self.max_in_flight = 8
+        self._inputs = []
+        self.adaptive_batch_size = False
+        self.max_batch_size = 20000
+        self.max_batch_bytes = 8 * 1024 * 1024
+        self.target_batch_latency = 1.0
+        self._batch_sizer = None
+        self.checkpoint_dir = default_checkpoint_dir
+        self._checkpoint = None
+        self.bisect_failures = True
+        self.dead_letter_dir = os.path.join(os.path.dirname(__file__), '..', '.dead_letters')
+        self._dead_letter_lock = threading.Lock()
+        self._exporter = None
+        self._dedup = None
+        self._columnar = False
+        self.preflight = "warn"
+        self.preflight_large_label = 100000
+        self._preflighted = set()
+        self.schema = []
+        self.schema_timeout = 300
+        self._index_usage = {}
+        self.metrics = ImportMetrics(type(self).__name__)
+        self.metrics_dir = os.path.join(os.path.dirname(__file__), '..', '.metrics')
+        # one core is left to the writes
+        self.processes = max(1, (os.cpu_count() or 1) - 1)
+        self.chunk_size = 10
+        self.spool_dir = os.path.join(os.path.dirname(__file__), '..', '.spool')
+        self.fingerprint_dir = os.path.join(os.path.dirname(__file__), '..', '.fingerprints')
+        self.report_removed = True
+        self._incremental = None
 
     def batch_store(self, query: str, parameters_iterator: Iterable, size: int = None, strategy: str = "aggregate",
-                    desc=""):
+                    desc="", checkpoint=None, dedup: dict = None, columnar: bool = False, fingerprint=None,
+                    **kwargs):
         """
         Ingest data in batches
         :seeAlso transaction_batch_store
         :seeAlso aggregate_batch_store
+        :seeAlso parallel_batch_store
+        :seeAlso async_batch_store
 
         :param query: the parametrized insertion query
         :param parameters_iterator: an iterator of the data to ingest as parameters for query
-        :param size: optional parameters_iterator's length
-        :param strategy: "aggregate" or "transaction"
+        :param size: optional parameters_iterator's length, when missing progress is tracked on the input files
+                     opened through open_input
+        :param strategy: "aggregate", "transaction", "parallel" or "async"
         :param desc: optional progress bar description
+        :param checkpoint: optional input file or directory (e.g. a spool) the rows are read from, in a stable
+                           order. When given, the committed offset is journaled and a re-run over the same,
+                           unchanged, input skips the rows already committed. Rows read from the graph (e.g. by a
+                           KeysetReader) can't be resumed by offset, as the rows committed change what is read:
+                           spool them first
+        :param dedup: optional {parameter name: item field or function of the item} of node keys. The distinct
+                      non null keys of every batch are sent as `$<parameter name>` next to `$batch`, sorted so that
+                      concurrent batches lock the nodes in the same order, and the query can MERGE each node once:
+                        UNWIND $diseases as name MERGE (:Disease {name: name})
+                        WITH count(*) as ignored
+                        UNWIND $batch as item
+                        MATCH (d:Disease {name: item.disease}) ...
+        :param columnar: send every batch as a dict of parallel lists, `$batch.<field>`, and its length, `$rows`,
+                         instead of a list of dicts, so that the field names are not repeated on every row.
+                         Queries reading `UNWIND $batch as item` rows are rewritten with util.payload.columnar_query.
+                         Rows computed as arrays can be given as util.payload.ColumnarRows, sent as slices of
+                         their columns
+        :param fingerprint: optional natural key of the rows (item field, function of the item, or True when the
+                            whole row is the key). With `--incremental` only the rows whose hash changed since the
+                            previous run, or with a new key, are sent, and the keys missing from the input are
+                            reported. The committed rows are recorded in the fingerprint store, the checkpoint
+                            is not needed and is ignored. See util.fingerprints
+        :param kwargs: strategy specific options (e.g. partition_key for "parallel")
         """
         method = getattr(self, f"{strategy}_batch_store", None)
         if method is None:
             raise ValueError(f"Unknown strategy {strategy}")
-        method(query, parameters_iterator, size, desc)
+        with self.batch_run(query, parameters_iterator, size, desc, checkpoint, dedup, columnar, fingerprint,
+                            batched=strategy != "transaction",
+                            partitioned=kwargs.get("partition_key") is not None) as (query, rows, size):
+            method(query, rows, size, desc, **kwargs)
+
+    @contextmanager
+    def batch_run(self, query: str, parameters_iterator: Iterable, size: int = None, desc="", checkpoint=None,
+                  dedup: dict = None, columnar: bool = False, fingerprint=None, batched: bool = True,
+                  partitioned: bool = False):
+        """
+        Set up a batch_store run and yield its (query, rows, size) to the strategy writing them
+          The query is rewritten for columnar batches and named in the metrics and the profiles, the schema is
+          applied and the query preflighted on the first rows, then the rows are filtered by the fingerprints of
+          an incremental run or resumed from the checkpoint, that is cleared once the block completes.
+        :seeAlso batch_store for the other parameters
+        :param batched: whether the strategy writes batches of rows rather than a row per query
+        :param partitioned: whether the strategy routes the rows to its writers by key
+        """
+        if not batched:
+            if dedup:
+                raise ValueError("dedup requires a batched strategy")
+            if columnar:
+                raise ValueError("columnar batches require a batched strategy")
+        if columnar:
+            query = columnar_query(query)
+        self.metrics.describe(query, desc)
+        self.named(desc or f"batch {hashlib.sha1(query.encode()).hexdigest()[:12]}", query)
+        if self.schema:
+            self.apply_schema()
+        self._dedup = self.get_dedup(dedup)
+        self._columnar = columnar
+        if fingerprint is not None and self.incremental:
+            if not batched:
+                raise ValueError("incremental imports require a batched strategy")
+            checkpoint = None
+            self._incremental = self.get_incremental(query, fingerprint)
+            parameters_iterator = self._incremental.changed(parameters_iterator)
+            size = None
+        try:
+            if self.preflight and query not in self._preflighted:
+                if isinstance(parameters_iterator, ColumnarRows):
+                    sample = parameters_iterator[:10]
+                else:
+                    parameters_iterator = iter(parameters_iterator)
+                    sample = list(islice(parameters_iterator, 10))
+                    parameters_iterator = chain(sample, parameters_iterator)
+                if sample:
+                    self.preflight_check(query, self.batch_parameters(sample) if batched else sample[0])
+            if checkpoint is not None:
+                if partitioned:
+                    raise ValueError("checkpoints are not supported with partitioned batches")
+                if not isinstance(checkpoint, (str, Path)) or not Path(checkpoint).exists():
+                    raise ValueError(f"the checkpoint must be the input file or directory, not {checkpoint!r}")
+                journal = CheckpointJournal(self.checkpoint_dir)
+                key = journal.key(type(self).__name__, query, checkpoint)
+                offset = journal.get(key)
+                if isinstance(parameters_iterator, ColumnarRows):
+                    parameters_iterator = parameters_iterator[offset:]
+                else:
+                    parameters_iterator = islice(parameters_iterator, offset, None)
+                if offset:
+                    print(f"resuming from row {offset}")
+                    size = max(0, size - offset) if size is not None else None
+                self._checkpoint = Checkpoint(journal, key, offset, importer=type(self).__name__,
+                                              source=str(checkpoint))
+            yield query, parameters_iterator, size
+            if self._checkpoint is not None:
+                self._checkpoint.clear()
+            if self._incremental is not None:
+                self.incremental_report()
+        finally:
+            self._checkpoint = None
+            self._dedup = None
+            self._columnar = False
+            if self._incremental is not None:
+                self._incremental.store.close()
+                self._incremental = None
+
+    def set_constraints(self):
+        self.apply_schema()
+
+    def get_incremental(self, query: str, fingerprint) -> IncrementalRun:
+        """
+        The incremental run of query, whose fingerprints are stored in `<fingerprint_dir>/<importer>.sqlite`
+        scoped by server, database and query
+        """
+        if fingerprint is True:
+            key = lambda item: row_hash(item).hex()
+        elif callable(fingerprint):
+            key = fingerprint
+        else:
+            key = lambda item, field=fingerprint: item.get(field)
+        store = FingerprintStore(os.path.join(self.fingerprint_dir, f"{type(self).__name__}.sqlite"))
+        scope = f"{self._connection[0]}/{self._database}/{hashlib.sha1(query.encode()).hexdigest()[:12]}"
+        return IncrementalRun(store, scope, key)
+
+    def incremental_report(self):
+        run = self._incremental
+        message = f"{run.sent} of {run.read} rows new or changed"
+        if self.report_removed:
+            path = os.path.join(self.fingerprint_dir, f"{type(self).__name__}.removed.jsonl")
+            removed = run.report_removed(path)
+            if removed:
+                message += f", {removed} keys removed from the source, see {path}"
+        print(message)
+
+    def setup_session(self):
+        """A session for the schema and preflight queries run before the writes"""
+        return self._driver.session(database=self._database)
+
+    def apply_schema(self):
+        """
+        Create the indexes and constraints declared in `self.schema` for `self._database`, if they are not in
+        place yet, and wait for them to be online. batch_store calls it before the first ingestion.
+        :seeAlso util.schema.SchemaRegistry
+        """
+        schema_registry.register(self._database, self.schema)
+        with self.setup_session() as session:
+            schema_registry.apply(session, self._database, self.schema_timeout)
+
+    def preflight_check(self, query: str, parameters: dict):
+        """
+        EXPLAIN query with sample parameters before running it, and warn (or raise a RuntimeError when
+        `self.preflight` is "fail") if its plan scans all the nodes, scans a label with more than
+        `self.preflight_large_label` nodes or builds a cartesian product. Every query is checked once.
+        :seeAlso util.preflight.explain
+        """
+        self._preflighted.add(query)
+        with self.setup_session() as session:
+            problems, self._index_usage[query] = explain(session, query, parameters, self.preflight_large_label)
+        if not problems:
+            return
+        message = "query plan of\n{}\nincludes: {}".format(query.strip(), ", ".join(problems))
+        if self.preflight == "fail":
+            raise RuntimeError(message)
+        print(f"WARNING: {message}")
+
+    def pipeline(self, items: Iterable, transform: Callable, setup: Callable = None, setup_args: tuple = (),
+                 ordered: bool = True):
+        """
+        Run a CPU bound transformation of the input (NLP, entity linking, ...) in `self.processes` worker processes,
+        so that it overlaps with the writes instead of running between them. The rows are meant for batch_store:
+            documents = self.pipeline(self.get_documents(path), self.enrich_document, setup=self.load_nlp)
+            self.batch_store(query, documents, size=size)
+        :seeAlso util.pipeline.process_map
+        :param items: the input to transform, read in this process
+        :param transform: picklable function(state, item) returning the row of item, or None to skip it
+        :param setup: optional function building the state passed to transform once per worker (e.g. an NLP model)
+        :param setup_args: the arguments of setup
+        :param ordered: keep the order of items, required with checkpoints
+        """
+        return process_map(transform, items, setup, setup_args, self.processes, self.chunk_size, ordered)
+
+    def split_rows(self, path, parse: Callable, parse_args: tuple = (), skip: int = 0, encoding="utf-8",
+                   range_bytes: int = 4 * 1024 * 1024):
+        """
+        Parse a large line oriented file (TSV, RRF, ...) in `self.processes` worker processes, each reading a range of
+        lines through mmap, and yield the rows in the order of the file so checkpoints still apply:
+            header = first_line(path).split("\\t")
+            rows = self.split_rows(path, self.parse_lines, (header,), skip=1)
+        Compressed files can't be split, they are decompressed in a background thread and parsed in this process.
+        :seeAlso util.line_index.LineIndex
+        :param path: the file to read
+        :param parse: picklable function(lines, *parse_args) returning the rows of a text stream of lines, read as
+                      a file opened with newline=''
+        :param parse_args: the arguments of parse after lines
+        :param skip: the number of lines to skip at the beginning of the file, e.g. 1 for a header
+        :param encoding: the file's encoding
+        :param range_bytes: the approximate size of the ranges parsed at once
+        """
+        with open(path, "rb") as raw:
+            kind = compression(raw)
+        if kind is not None:
+            with self.open_input(path, encoding=encoding, newline='') as lines:
+                for _ in islice(lines, skip):
+                    pass
+                yield from parse(lines, *parse_args)
+            return
+
+        index = LineIndex(path)
+        progress = RangeProgress()
+        self._inputs.append((progress, index.size))
+        try:
+            ranges = index.ranges(skip, range_bytes)
+            ends = (end for _, end, _ in ranges)
+            for rows in process_map(parse_range, ((path, start, end) for start, end, _ in ranges), range_parser,
+                                    (parse, parse_args, encoding), self.processes, chunk_size=1):
+                progress.position = next(ends)
+                yield from rows
+        finally:
+            progress.closed = True
+
+    def spooled(self, name: str, rows: Iterable, source=None, size=None, desc="") -> Spool:
+        """
+        Save rows to a local spool and return it, or return the spool saved by a previous run without iterating rows
+          The expensive transformation feeding the writes (NLP, entity linking, ...) then runs once: when the writes
+          fail the next run reads the spool instead, and with a checkpoint resumes from the last committed batch
+          as the spool order is stable. Remove `<spool_dir>/<importer>/<name>` to compute the rows again.
+            documents = self.spooled("documents", self.pipeline(...), source=data_path)
+            self.batch_store(query, documents, size=len(documents), checkpoint=documents.directory)
+        :seeAlso util.spool.Spool
+        :param name: the spool name, unique for the importer
+        :param rows: the rows to save, typically a generator running the transformation
+        :param source: optional input file or directory of the rows, the spool is written again when it changes
+        :param size: optional number of rows, for the progress bar
+        :param desc: optional progress bar description
+        """
+        spool = Spool(os.path.join(self.spool_dir, type(self).__name__, name))
+        if spool.is_complete(source):
+            print(f"reading {len(spool)} rows from {spool.directory}")
+        else:
+            spool.write(rows, source, self.get_progress(size, desc or f"spooling {name}"))
+        return spool
 
     def transaction_batch_store(self, query, parameters_iterator, size=None, desc=""):
         """
@@ -38,15 +406,111 @@ class BaseImporter(GraphDBBase):
         :param size:optional parameters_iterator's length
         :param desc: optional progress bar description
         """
-        parameters_iterator = tqdm(parameters_iterator, total=size, desc=desc)
+        progress = self.get_progress(size, desc)
         with self._driver.session(database=self._database) as session:
             tx = session.begin_transaction()
+            start, payload_bytes = time.perf_counter(), 0
+            item_count = 0
             for item_count, parameters in enumerate(parameters_iterator, start=1):
                 tx.run(query, parameters)
+                payload_bytes += payload_size(parameters)
+                progress.update(1)
                 if item_count % self.batch_size == 0:
                     tx.commit()
+                    self.metrics.record(query, self.batch_size, time.perf_counter() - start, payload_bytes)
+                    if self._checkpoint is not None:
+                        self._checkpoint.committed(item_count)
                     tx = session.begin_transaction()
+                    start, payload_bytes = time.perf_counter(), 0
             tx.commit()
+            if item_count % self.batch_size:
+                self.metrics.record(query, item_count % self.batch_size, time.perf_counter() - start, payload_bytes)
+        progress.close()
+
+    def export_store(self, parameters_iterator: Iterable, nodes: list = (), relationships: list = (), size=None,
+                     desc=""):
+        """
+        Write data to the CSV files of an offline bulk import instead of running Cypher
+          Files go to `self.export_dir` and are shared by all the export_store calls of this importer,
+          close() writes the neo4j-admin command importing them to `<export_dir>/import.sh`.
+        :seeAlso util.bulk_export
+        :param parameters_iterator: an iterator of the data to export, as for batch_store
+        :param nodes: a list of NodeExport mapping each item to nodes
+        :param relationships: a list of RelationshipExport mapping each item to relationships
+        :param size: optional parameters_iterator's length
+        :param desc: optional progress bar description
+        """
+        if self._exporter is None:
+            self._exporter = BulkExporter(self.export_dir)
+        progress = self.get_progress(size, desc)
+
+        def rows():
+            for batch in self.get_batches(iter(parameters_iterator), self.batch_size):
+                yield from batch
+                progress.update(len(batch))
+
+        self._exporter.export(rows(), nodes, relationships)
+        progress.close()
+
+    def close(self):
+        self.save_reports()
+        super().close()
+
+    def save_reports(self):
+        """Write the bulk import command, print the schema usage and save the metrics of the run"""
+        if self._exporter is not None:
+            command = self._exporter.close(self._database)
+            print(f"exported {self._exporter.nodes} nodes and {self._exporter.relationships} relationships, "
+                  f"import them with:\n{command}")
+            self._exporter = None
+        if self.schema and self._index_usage:
+            names = {query: metrics["desc"] for query, metrics in
+                     ((m["query"], m) for m in self.metrics.summary()["queries"]) if metrics["desc"]}
+            print(f"schema of {self._database}:\n" +
+                  schema_registry.usage_report(self._database, self._index_usage, names))
+        if self.metrics:
+            path = self.metrics.save(self.metrics_dir)
+            print(self.metrics.report())
+            print(f"import metrics saved to {path}")
+
+    def get_progress(self, size=None, desc=""):
+        """
+        Start tracking the progress of a new ingestion
+        :param size: optional number of rows to ingest
+        :param desc: optional progress bar description
+        """
+        # drop the files of the previous ingestions, the ones already opened by this one (e.g. while
+        # sampling the first rows for the preflight check) are still open
+        self._inputs = [(raw, total) for raw, total in self._inputs if not raw.closed]
+        return ImportProgress(self._inputs, size, desc)
+
+    def open_input(self, path, encoding="utf-8", newline=None):
+        """
+        Open an input file in text mode keeping track of the bytes read from it,
+        so batch_store can report progress in a single pass over the data
+          gzip and bz2 files are decompressed on the fly by a background thread (see util.decompress),
+          progress is then measured on the compressed bytes
+        :param path: the file to read, plain, gzip or bz2 compressed
+        :param encoding: the file's encoding
+        :param newline: as in the built-in open, use '' for files parsed by the csv module
+        """
+        raw = open(path, "rb", buffering=0)
+        self._inputs.append((raw, os.fstat(raw.fileno()).st_size))
+        kind = compression(raw)
+        if kind is None:
+            return io.TextIOWrapper(io.BufferedReader(raw), encoding=encoding, newline=newline)
+        # large reads, so the decompressed blocks are handed over in a few copies
+        stream = io.BufferedReader(DecompressingReader(raw, kind), buffer_size=1024 * 1024)
+        return io.TextIOWrapper(stream, encoding=encoding, newline=newline)
+
+    @staticmethod
+    def find_input(path):
+        """path, or its compressed copy path.gz or path.bz2 when only that exists"""
+        path = Path(path)
+        for candidate in (path, path.with_name(path.name + ".gz"), path.with_name(path.name + ".bz2")):
+            if candidate.is_file():
+                return candidate
+        return path
 
     @staticmethod
     def get_csv_size(HMDD_file, encoding="utf-8"):
@@ -61,6 +525,158 @@ class BaseImporter(GraphDBBase):
             else:
                 return
 
+    def iter_batches(self, parameters_iterator):
+        """
+        Split parameters_iterator in batches of `self.batch_size` items or, when `self.adaptive_batch_size`
+        is set, in batches sized by an AdaptiveBatchSize starting from `self.batch_size`
+        """
+        if isinstance(parameters_iterator, ColumnarRows) and not self.adaptive_batch_size:
+            self._batch_sizer = None
+            batches = parameters_iterator.batches(self.batch_size)
+        elif not self.adaptive_batch_size:
+            self._batch_sizer = None
+            batches = self.get_batches(iter(parameters_iterator), self.batch_size)
+        else:
+            self._batch_sizer = AdaptiveBatchSize(self.batch_size, max_size=self.max_batch_size,
+                                                  max_bytes=self.max_batch_bytes,
+                                                  target_latency=self.target_batch_latency)
+            batches = self._batch_sizer.batches(parameters_iterator)
+        if self._checkpoint is not None:
+            batches = self._checkpoint.track(batches)
+        return batches
+
+    def record_batch(self, query: str, batch: list, latency: float, counters: list = (), failed: int = 0,
+                     payload_bytes: int = None):
+        """
+        Account for a committed batch
+        :param query: the query that wrote it
+        :param batch: the batch parameters
+        :param latency: the seconds taken to write it
+        :param counters: the counters dicts of the transactions that wrote it
+        :param failed: the number of its rows sent to the dead-letter file
+        :param payload_bytes: the size of the parameters sent, when missing the size of batch
+        """
+        totals = {}
+        for transaction in counters:
+            for name, value in transaction.items():
+                totals[name] = totals.get(name, 0) + value
+        if payload_bytes is None:
+            payload_bytes = payload_size(batch)
+        self.metrics.record(query, len(batch) - failed, latency, payload_bytes, totals)
+        if self._batch_sizer is not None:
+            self._batch_sizer.record(len(batch), latency)
+        if self._checkpoint is not None:
+            self._checkpoint.commit(batch)
+        if self._incremental is not None:
+            self._incremental.committed(batch)
+
+    @staticmethod
+    def get_dedup(dedup: dict):
+        if not dedup:
+            return None
+        return {name: key if callable(key) else (lambda item, field=key: item.get(field))
+                for name, key in dedup.items()}
+
+    def batch_parameters(self, batch: list) -> dict:
+        """
+        The query parameters of batch: `$batch` (and `$rows` when batch_store was called with columnar) and,
+        when batch_store was called with dedup, the distinct node keys of the batch
+        """
+        if self._columnar:
+            parameters = {"batch": to_columns(batch), "rows": len(batch)}
+        else:
+            parameters = {"batch": batch if isinstance(batch, list) else list(batch)}
+        for name, key in (self._dedup or {}).items():
+            keys = list(dict.fromkeys(k for k in map(key, batch) if k is not None))
+            try:
+                keys.sort()
+            except TypeError:
+                pass
+            parameters[name] = keys
+        return parameters
+
+    @staticmethod
+    def run_write(session, query, parameters: dict):
+        """
+        Run query in a managed write transaction: the driver retries it with exponential backoff
+        on transient errors (deadlocks, leader switches, ...) up to its max_transaction_retry_time
+        :return: the transaction counters as a dict
+        """
+        execute_write = getattr(session, "execute_write", None) or session.write_transaction  # neo4j 4.4
+        return execute_write(lambda tx: counters_dict(tx.run(query, parameters).consume().counters))
+
+    def write_batch(self, session, query, batch: list):
+        start = time.perf_counter()
+        counters = []
+        sent = []
+
+        def write(rows: list):
+            parameters = self.batch_parameters(rows)
+            sent.append(payload_size(parameters))
+            counters.append(self.run_write(session, query, parameters))
+
+        failures = self.isolate_failures(write, query, batch)
+        self.record_batch(query, batch, time.perf_counter() - start, counters, len(failures), sum(sent))
+
+    @staticmethod
+    def is_row_error(error: Exception):
+        """
+        Tell whether error may be caused by the content of some rows (e.g. a null key in a MERGE)
+        rather than by the query itself (a syntax error, a missing procedure or parameter) or by the connection
+        """
+        return (isinstance(error, ClientError) and not isinstance(error, (CypherSyntaxError, AuthError, Forbidden))
+                and not (error.code or "").startswith(QUERY_ERRORS))
+
+    def bisect(self, write: Callable, batch: list):
+        """
+        Write batch splitting it recursively on failures caused by its rows
+        :param write: function writing a list of rows
+        :param batch: the rows to write
+        :return: the list of (row, error) that could not be written
+        """
+        try:
+            write(batch)
+            return []
+        except Exception as e:
+            if not self.bisect_failures or not self.is_row_error(e):
+                raise
+            if len(batch) == 1:
+                return [(batch[0], e)]
+        middle = len(batch) // 2
+        return self.bisect(write, batch[:middle]) + self.bisect(write, batch[middle:])
+
+    def isolate_failures(self, write: Callable, query: str, batch: list):
+        """
+        Write batch isolating the poison rows, that are saved to the dead-letter file while the rest
+        of the batch is committed. When every row fails the problem is not in the data and the error is raised.
+        :return: the list of (row, error) sent to the dead-letter file
+        """
+        failures = self.bisect(write, batch)
+        if not failures:
+            return failures
+        if len(failures) == len(batch) > 1:
+            raise failures[0][1]
+        self.dead_letter(query, failures)
+        return failures
+
+    def dead_letter(self, query: str, failures: list):
+        """
+        Append the rows that could not be written to `<dead_letter_dir>/<importer>.jsonl`
+        :param query: the failing query
+        :param failures: a list of (row, error)
+        """
+        path = os.path.join(self.dead_letter_dir, f"{type(self).__name__}.jsonl")
+        self.metrics.failed(query, len(failures))
+        if self._incremental is not None:
+            self._incremental.failed([row for row, _ in failures])
+        with self._dead_letter_lock:
+            os.makedirs(self.dead_letter_dir, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                for row, error in failures:
+                    f.write(json.dumps({"time": time.time(), "query": query, "error": str(error), "row": row},
+                                       default=str) + "\n")
+        print(f"{len(failures)} rows could not be written, see {path}")
+
     def aggregate_batch_store(self, query, parameters_iterator, size=None, desc=""):
         """
         Ingest data in batches
@@ -71,8 +687,109 @@ class BaseImporter(GraphDBBase):
         :param size:optional parameters_iterator's length
         :param desc: optional progress bar description
         """
-        parameters_batches = self.get_batches(parameters_iterator, self.batch_size)
-        parameters_batches = tqdm(parameters_batches, total=math.ceil(size / self.batch_size), desc=desc)
+        progress = self.get_progress(size, desc)
         with self._driver.session(database=self._database) as session:
-            for batch in parameters_batches:
-                session.run(query, {"batch": batch})
+            for batch in self.iter_batches(parameters_iterator):
+                self.write_batch(session, query, batch)
+                progress.update(len(batch))
+        progress.close()
+
+    def parallel_batch_store(self, query, parameters_iterator, size=None, desc="",
+                             partition_key: Callable = None):
+        """
+        Ingest data in batches written concurrently by a pool of worker sessions
+          Like aggregate_batch_store the query should contain `UNWIND $batch as item` as first statement.
+          Batches are handed to `self.workers` threads, each one owning its own session, through a queue
+          holding at most `self.max_in_flight` batches, so the producer never runs too far ahead of the writers.
+          When partition_key is given, items sharing the same key are always written by the same worker,
+          so MERGEs on the same node are serialized instead of racing each other.
+        :param query: the parametrized insertion query
+        :param parameters_iterator: an iterator of the data to ingest as parameters for query
+        :param size: optional parameters_iterator's length
+        :param desc: optional progress bar description
+        :param partition_key: optional function mapping an item to the key used to route it to a worker
+        """
+        workers = max(1, self.workers)
+        if partition_key is None:
+            queues = [queue.Queue(maxsize=max(1, self.max_in_flight))]
+        else:
+            queues = [queue.Queue(maxsize=max(1, self.max_in_flight // workers)) for _ in range(workers)]
+        errors = []
+        progress = self.get_progress(size, desc)
+
+        def write(batches: queue.Queue):
+            session = None
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if errors:
+                    # keep draining so that the producer is never blocked by a failed worker
+                    continue
+                try:
+                    if session is None:
+                        session = self._driver.session(database=self._database)
+                    self.write_batch(session, query, batch)
+                    progress.update(len(batch))
+                except Exception as e:
+                    errors.append(e)
+            if session is not None:
+                session.close()
+
+        threads = [threading.Thread(target=write, args=(queues[i % len(queues)],), daemon=True)
+                   for i in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            if partition_key is None:
+                for batch in self.iter_batches(parameters_iterator):
+                    if errors:
+                        break
+                    queues[0].put(batch)
+            else:
+                self._batch_sizer = None
+                pending = [[] for _ in queues]
+                for parameters in parameters_iterator:
+                    if errors:
+                        break
+                    partition = hash(partition_key(parameters)) % len(queues)
+                    pending[partition].append(parameters)
+                    if len(pending[partition]) >= self.batch_size:
+                        queues[partition].put(pending[partition])
+                        pending[partition] = []
+                for partition, batch in enumerate(pending):
+                    if batch and not errors:
+                        queues[partition].put(batch)
+        finally:
+            for i in range(workers):
+                queues[i % len(queues)].put(None)
+            for thread in threads:
+                thread.join()
+            progress.close()
+
+        if errors:
+            raise errors[0]
+
+    def async_batch_store(self, query, parameters_iterator, size=None, desc=""):
+        """
+        Ingest data in batches pipelined over the asyncio driver (requires neo4j>=5)
+          Up to `self.max_in_flight` batches are written at the same time while parameters_iterator keeps
+          producing the next ones in a worker thread. The query should contain `UNWIND $batch as item`
+          as first statement, as for aggregate_batch_store.
+        :param query: the parametrized insertion query
+        :param parameters_iterator: an iterator of the data to ingest as parameters for query
+        :param size: optional parameters_iterator's length
+        :param desc: optional progress bar description
+        """
+        from util.async_base_importer import get_async_driver, pipelined_store
+
+        async def store():
+            driver = get_async_driver(*self._connection)
+            try:
+                await pipelined_store(self, driver, query, self.iter_batches(parameters_iterator),
+                                      self.get_progress(size, desc))
+            finally:
+                await driver.close()
+
+        asyncio.run(store())
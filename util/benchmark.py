@@ -0,0 +1,75 @@
+import sys
+import time
+from itertools import islice
+
+from util.base_importer import BaseImporter
+from util.payload import payload_size, to_columns
+
+
+class ImporterBenchmark(BaseImporter):
+    """
+    Compare the throughput of the batch_store strategies on a synthetic dataset
+      PYTHONPATH=. python util/benchmark.py -d benchmark -r 200000 -t aggregate,parallel,async [-c]
+    Every strategy ingests the same rows into an empty `BenchmarkNode` label of the target database,
+    with -c every batched strategy runs a second time with columnar batches.
+    """
+
+    def __init__(self, argv):
+        super().__init__(command=__file__, argv=argv, extended_options='r:t:c',
+                         extended_long_options=['rows=', 'strategies=', 'columnar'])
+        self._database = self.database
+        self.rows = int(self.get_option(['-r', '--rows'], 100000))
+        self.strategies = self.get_option(['-t', '--strategies'], 'aggregate,parallel,async').split(',')
+        self.columnar = self.get_option(['-c', '--columnar']) is not None
+
+    def set_constraints(self):
+        with self._driver.session(database=self._database) as session:
+            session.run("CREATE CONSTRAINT benchmark_node_id IF NOT EXISTS FOR (n:BenchmarkNode) REQUIRE n.id IS UNIQUE")
+
+    def clean(self):
+        with self._driver.session(database=self._database) as session:
+            session.run("""
+            MATCH (n:BenchmarkNode)
+            CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS""")
+
+    def get_rows(self):
+        for i in range(self.rows):
+            yield {"id": i, "name": f"node {i}", "group": i % 100, "value": i / 3}
+
+    def payload_report(self):
+        """Compare the bytes on the wire of a batch of rows sent as a list of dicts and as columns"""
+        batch = list(islice(self.get_rows(), self.batch_size))
+        sizes = {"rows": payload_size({"batch": batch}),
+                 "columnar": payload_size({"batch": to_columns(batch), "rows": len(batch)})}
+        print(f"{'payload':<12}{'bytes':>10}{'bytes/row':>12}")
+        for payload, size in sizes.items():
+            print(f"{payload:<12}{size:>10}{size / len(batch):>12.1f}")
+
+    def run(self):
+        query = """
+        UNWIND $batch as item
+        MERGE (n:BenchmarkNode {id: item.id})
+        SET n.name = item.name, n.group = item.group, n.value = item.value
+        """
+        self.set_constraints()
+        results = {}
+        for strategy in self.strategies:
+            for columnar in ([False, True] if self.columnar and strategy != "transaction" else [False]):
+                name = f"{strategy}+columnar" if columnar else strategy
+                self.clean()
+                start = time.perf_counter()
+                self.batch_store(query, self.get_rows(), size=self.rows, strategy=strategy, desc=name,
+                                 columnar=columnar)
+                results[name] = time.perf_counter() - start
+        self.clean()
+
+        self.payload_report()
+        print(f"{'strategy':<20}{'seconds':>10}{'rows/s':>12}")
+        for strategy, elapsed in results.items():
+            print(f"{strategy:<20}{elapsed:>10.2f}{self.rows / elapsed:>12.0f}")
+
+
+if __name__ == '__main__':
+    benchmark = ImporterBenchmark(argv=sys.argv[1:])
+    benchmark.run()
+    benchmark.close()
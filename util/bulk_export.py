@@ -0,0 +1,228 @@
+import csv
+import shlex
+from pathlib import Path
+from typing import Callable, Iterable, Union
+
+Field = Union[str, Callable]
+
+
+def _getter(field: Field) -> Callable:
+    if callable(field):
+        return field
+    return lambda row: row.get(field)
+
+
+def _format(value):
+    if isinstance(value, (list, tuple)):
+        return ";".join(str(v) for v in value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+class NodeExport:
+    """
+    Describe how the rows of a generator map to nodes
+      The key identifies the node (as the properties of a MERGE do): the same key is exported only once
+      per id space, keeping the properties of its first occurrence.
+    :param label: the node label, or labels separated by ':'
+    :param id_property: the name of the property storing the key, e.g. "id" or "name"
+    :param key: row field, or function of the row, returning the key. Rows with a None key are skipped
+    :param properties: optional {"name[:type]": field or function} of the other properties,
+                       type is any neo4j-admin type (int, float, boolean, string[], ...)
+    :param id_space: the id space of the key, defaults to the first label
+    """
+
+    def __init__(self, label: str, id_property: str, key: Field, properties: dict = None, id_space: str = None):
+        self.label = label
+        self.id_property = id_property
+        self.key = _getter(key)
+        self.properties = {name: _getter(field) for name, field in (properties or {}).items()}
+        self.id_space = id_space or label.split(":")[0]
+
+    def header(self):
+        return [f"{self.id_property}:ID({self.id_space})", ":LABEL"] + list(self.properties)
+
+    def record(self, row):
+        key = self.key(row)
+        if key is None:
+            return None, None
+        # the labels are an array column, split on the --array-delimiter of the import command
+        return key, [key, ";".join(self.label.split(":"))] + [_format(get(row)) for get in self.properties.values()]
+
+
+class RelationshipExport:
+    """
+    Describe how the rows of a generator map to relationships
+    :param type: the relationship type
+    :param start: the NodeExport of the start node (only its id space and key are used)
+    :param end: the NodeExport of the end node
+    :param properties: optional {"name[:type]": field or function} of the relationship properties
+    :param where: optional predicate on the row, rows not satisfying it are skipped
+    :param unique: export the same relationship only once, as a MERGE would do
+    :param merge_on: the properties identifying the relationship together with its endpoints, as the properties
+                     of the MERGE pattern; defaults to all of them. The other properties are the ones of the last
+                     occurrence, as a MERGE followed by a SET would leave them, so those relationships are held
+                     in memory and written when the exporter is closed
+    """
+
+    def __init__(self, type: str, start: NodeExport, end: NodeExport, properties: dict = None,
+                 where: Callable = None, unique: bool = True, merge_on: list = None):
+        self.type = type
+        self.start = start
+        self.end = end
+        self.properties = {name: _getter(field) for name, field in (properties or {}).items()}
+        self.where = where
+        self.unique = unique
+        self.merge_on = merge_on
+        names = list(self.properties)
+        self._identity = [0, 1] + [3 + names.index(name) for name in (names if merge_on is None else merge_on)]
+
+    def header(self):
+        return [f":START_ID({self.start.id_space})", f":END_ID({self.end.id_space})", ":TYPE"] + list(self.properties)
+
+    def record(self, row):
+        if self.where is not None and not self.where(row):
+            return None
+        start, end = self.start.key(row), self.end.key(row)
+        if start is None or end is None:
+            return None
+        return [start, end, self.type] + [_format(get(row)) for get in self.properties.values()]
+
+    @property
+    def updates(self):
+        """Whether later occurrences of the same relationship replace some of its properties"""
+        return self.unique and self.merge_on is not None and set(self.merge_on) != set(self.properties)
+
+    def identity(self, record: list):
+        return tuple(record[i] for i in self._identity)
+
+
+class ShardedCsv:
+    """A header file plus data files of at most shard_size rows each"""
+
+    def __init__(self, directory: Path, name: str, header: list, shard_size: int):
+        self.directory = directory
+        self.name = name
+        self.shard_size = shard_size
+        self.files = [directory / f"{name}.header.csv"]
+        with self.files[0].open("w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow(header)
+        self._file = None
+        self._writer = None
+        self._rows = 0
+
+    def write(self, record: list):
+        if self._file is None or self._rows >= self.shard_size:
+            self.close()
+            self.files.append(self.directory / f"{self.name}.part-{len(self.files) - 1:04d}.csv")
+            self._file = self.files[-1].open("w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            self._rows = 0
+        self._writer.writerow(record)
+        self._rows += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BulkExporter:
+    """
+    Stream rows into the CSV files of an offline `neo4j-admin database import full`
+      Nodes are deduplicated on their key within each id space and, by default, relationships on their
+      endpoints, type and properties, so that exporting the rows of a MERGE based importer yields the
+      same graph. Several generators can be exported in the same directory before calling close().
+    :param directory: the output directory, nodes and relationships go to its `nodes` and `relationships` folders
+    :param shard_size: the maximum number of rows of each data file
+    """
+
+    def __init__(self, directory, shard_size=1000000):
+        self.directory = Path(directory).resolve()
+        self.shard_size = shard_size
+        (self.directory / "nodes").mkdir(parents=True, exist_ok=True)
+        (self.directory / "relationships").mkdir(parents=True, exist_ok=True)
+        self._node_files = {}
+        self._relationship_files = {}
+        self._node_keys = {}
+        self._relationship_keys = {}
+        # {type: {identity: (file, record)}} of the relationships written on close
+        self._pending_relationships = {}
+        self.nodes = 0
+        self.relationships = 0
+
+    def _node_csv(self, node: NodeExport):
+        name = (node.label.replace(":", "_"), tuple(node.header()))
+        if name not in self._node_files:
+            file_name = f"{name[0]}_{len(self._node_files)}"
+            self._node_files[name] = ShardedCsv(self.directory / "nodes", file_name, node.header(), self.shard_size)
+        return self._node_files[name]
+
+    def _relationship_csv(self, relationship: RelationshipExport):
+        name = (relationship.type, tuple(relationship.header()))
+        if name not in self._relationship_files:
+            file_name = f"{relationship.type}_{len(self._relationship_files)}"
+            self._relationship_files[name] = ShardedCsv(self.directory / "relationships", file_name,
+                                                        relationship.header(), self.shard_size)
+        return self._relationship_files[name]
+
+    def export(self, rows: Iterable, nodes: list = (), relationships: list = ()):
+        """
+        Export every row as the given nodes and relationships
+        :param rows: an iterator of rows, usually an importer's get_rows generator
+        :param nodes: a list of NodeExport
+        :param relationships: a list of RelationshipExport
+        """
+        node_files = [(node, self._node_csv(node), self._node_keys.setdefault(node.id_space, set()))
+                      for node in nodes]
+        relationship_files = [(rel, self._relationship_csv(rel), self._relationship_keys.setdefault(rel.type, set()))
+                              for rel in relationships]
+        for row in rows:
+            for node, file, keys in node_files:
+                key, record = node.record(row)
+                if key is None or key in keys:
+                    continue
+                keys.add(key)
+                file.write(record)
+                self.nodes += 1
+            for relationship, file, keys in relationship_files:
+                record = relationship.record(row)
+                if record is None:
+                    continue
+                if relationship.updates:
+                    pending = self._pending_relationships.setdefault(relationship.type, {})
+                    key = relationship.identity(record)
+                    if key not in pending:
+                        self.relationships += 1
+                    pending[key] = (file, record)
+                    continue
+                if relationship.unique:
+                    key = relationship.identity(record)
+                    if key in keys:
+                        continue
+                    keys.add(key)
+                file.write(record)
+                self.relationships += 1
+
+    def command(self, database: str):
+        """The neo4j-admin command importing the exported files into database"""
+        # relationships whose endpoints were not exported make the import fail instead of being skipped silently
+        arguments = ["neo4j-admin", "database", "import", "full", database, "--array-delimiter=;"]
+        for file in self._node_files.values():
+            arguments.append("--nodes=" + ",".join(str(f) for f in file.files))
+        for file in self._relationship_files.values():
+            arguments.append("--relationships=" + ",".join(str(f) for f in file.files))
+        return " ".join(shlex.quote(a) for a in arguments)
+
+    def close(self, database: str):
+        """Write the pending relationships, close the data files and write the import command to `import.sh`"""
+        for pending in self._pending_relationships.values():
+            for file, record in pending.values():
+                file.write(record)
+        self._pending_relationships = {}
+        for file in list(self._node_files.values()) + list(self._relationship_files.values()):
+            file.close()
+        command = self.command(database)
+        (self.directory / "import.sh").write_text(command + "\n")
+        return command
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+default_checkpoint_dir = os.path.join(os.path.dirname(__file__), '..', '.checkpoints')
+
+
+def fingerprint(source) -> str:
+    """
+    Identify an import source
+      A file is identified by its size, modification time and the content of its first and last 64KB,
+      a directory by the same properties of the files it contains, anything else (e.g. the read query
+      driving a generator) by its string representation.
+    """
+    digest = hashlib.sha1()
+    if isinstance(source, (str, Path)) and Path(source).is_dir():
+        for file in sorted(p for p in Path(source).rglob("*") if p.is_file()):
+            stat = file.stat()
+            digest.update(f"{file.relative_to(source)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    elif isinstance(source, (str, Path)) and Path(source).is_file():
+        stat = Path(source).stat()
+        digest.update(f"{stat.st_size}:{stat.st_mtime_ns};".encode())
+        with open(source, "rb") as f:
+            digest.update(f.read(65536))
+            if stat.st_size > 65536:
+                f.seek(max(65536, stat.st_size - 65536))
+                digest.update(f.read())
+    else:
+        digest.update(str(source).encode())
+    return digest.hexdigest()
+
+
+class CheckpointJournal:
+    """
+    Persistent journal of the rows committed by batch_store runs
+      Every entry is keyed by importer, query and input fingerprint and stores the number of rows,
+      counted from the beginning of the input, that are known to be committed.
+    """
+
+    def __init__(self, directory=default_checkpoint_dir):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def key(importer: str, query: str, source) -> str:
+        return hashlib.sha1(f"{importer}\n{query}\n{fingerprint(source)}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> int:
+        path = self._path(key)
+        if not path.is_file():
+            return 0
+        return json.load(path.open())["offset"]
+
+    def save(self, key: str, offset: int, **info):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(key).with_suffix(".tmp")
+        with tmp.open("w") as f:
+            json.dump({"offset": offset, "updated": time.time(), **info}, f)
+        os.replace(tmp, self._path(key))
+
+    def clear(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+
+class Checkpoint:
+    """
+    Tracks the batches of a batch_store run and saves the committed offset after every commit
+      Batches may be committed out of order (parallel and async strategies): the saved offset is the
+      end of the longest run of committed batches starting from the beginning of the input.
+    """
+
+    def __init__(self, journal: CheckpointJournal, key: str, offset: int = 0, **info):
+        self.journal = journal
+        self.key = key
+        self.start = offset
+        self.offset = offset
+        self.info = info
+        self._next = offset
+        self._ranges = {}
+        self._done = {}
+        self._lock = threading.Lock()
+
+    def track(self, batches):
+        for batch in batches:
+            with self._lock:
+                self._ranges[id(batch)] = self._next
+                self._next += len(batch)
+            yield batch
+
+    def commit(self, batch: list):
+        with self._lock:
+            start = self._ranges.pop(id(batch), None)
+            if start is None:
+                return
+            self._done[start] = start + len(batch)
+            offset = self.offset
+            while offset in self._done:
+                offset = self._done.pop(offset)
+            if offset != self.offset:
+                self.offset = offset
+                self.journal.save(self.key, offset, **self.info)
+
+    def committed(self, rows: int):
+        """Record that the first `rows` items after the starting offset are committed"""
+        with self._lock:
+            self.offset = self.start + rows
+            self.journal.save(self.key, self.offset, **self.info)
+
+    def clear(self):
+        self.journal.clear(self.key)
@@ -0,0 +1,108 @@
+import bz2
+import io
+import queue
+import threading
+import zlib
+
+MAGIC = {b"\x1f\x8b": "gzip", b"BZh": "bz2"}
+
+
+def compression(raw) -> str:
+    """The compression of the binary file raw, "gzip", "bz2" or None, read from its first bytes"""
+    head = raw.read(3)
+    raw.seek(0)
+    for magic, kind in MAGIC.items():
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def _decompressor(kind: str):
+    # wbits | 16: gzip header and trailer
+    return zlib.decompressobj(zlib.MAX_WBITS | 16) if kind == "gzip" else bz2.BZ2Decompressor()
+
+
+class DecompressingReader(io.RawIOBase):
+    """
+    Read only stream of the decompressed content of a gzip or bz2 file
+      A background thread reads and inflates raw in blocks of block_size compressed bytes, keeping at most
+      max_blocks decompressed blocks ahead of the reader. zlib and bz2 release the GIL while decompressing,
+      so the rows are parsed while the next blocks are inflated, and the file is never unpacked on disk.
+      Concatenated members, as written by pigz, bgzip or pbzip2, are read one after the other.
+    :param raw: the compressed file, opened in binary mode, it is closed with the reader
+    :param kind: "gzip" or "bz2"
+    :param block_size: the number of compressed bytes decompressed at once
+    :param max_blocks: the number of decompressed blocks buffered ahead of the reader
+    """
+
+    def __init__(self, raw, kind: str, block_size: int = 256 * 1024, max_blocks: int = 16):
+        super().__init__()
+        self._raw = raw
+        self._kind = kind
+        self._block_size = block_size
+        self._blocks = queue.Queue(max_blocks)
+        self._stop = threading.Event()
+        self._block = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._inflate, daemon=True, name=f"inflate {getattr(raw, 'name', '')}")
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        # gives up when the reader is closed before the end of the file
+        while not self._stop.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _inflate(self):
+        try:
+            decompressor, started = _decompressor(self._kind), False
+            while not self._stop.is_set():
+                data = self._raw.read(self._block_size)
+                if not data:
+                    if started:
+                        raise EOFError(f"{getattr(self._raw, 'name', 'input')} ended before the end of the "
+                                       f"{self._kind} stream")
+                    break
+                while data:
+                    started = True
+                    block = decompressor.decompress(data)
+                    if block and not self._put(block):
+                        return
+                    data = b""
+                    if decompressor.eof:
+                        # the next member, if any
+                        data = decompressor.unused_data
+                        decompressor, started = _decompressor(self._kind), False
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._block:
+            if self._eof:
+                return 0
+            block = self._blocks.get()
+            if block is None or isinstance(block, Exception):
+                self._eof = True
+                if block is not None:
+                    raise block
+                return 0
+            self._block = memoryview(block)
+        size = min(len(buffer), len(self._block))
+        buffer[:size] = self._block[:size]
+        self._block = self._block[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._raw.close()
+        super().close()
@@ -0,0 +1,142 @@
+import atexit
+import itertools
+import threading
+import traceback
+import weakref
+
+from neo4j import GraphDatabase
+
+
+class TrackedSession:
+    """
+    A session of a shared driver that unregisters itself when closed
+      Everything else is delegated to the driver session, so it is used exactly like it.
+    """
+
+    def __init__(self, registry: "DriverRegistry", key: tuple, session_id: int, session, origin: str):
+        self._registry = registry
+        self._key = key
+        self._id = session_id
+        self._session = session
+        self._finalizer = weakref.finalize(self, registry.leaked, key, session_id, session, origin)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        self._finalizer.detach()
+        self._registry.closed(self._key, self._id)
+        self._session.close()
+
+
+class SharedDriver:
+    """
+    Handle on a driver of the DriverRegistry: close() releases the handle and the driver, with its
+    connection pool, is closed only when its last handle is released
+    """
+
+    def __init__(self, registry: "DriverRegistry", key: tuple):
+        self._registry = registry
+        self._key = key
+        self._closed = False
+
+    @property
+    def driver(self):
+        return self._registry.drivers[self._key]
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+    def session(self, **config):
+        return self._registry.session(self._key, **config)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._registry.release(self._key)
+
+
+class DriverRegistry:
+    """
+    Process-wide pool of drivers keyed by (uri, user, database)
+      All the GraphDBBase instances of a process connecting to the same server share a single driver,
+      so they share its connection pool instead of paying the connection (and TLS) handshake again and
+      competing for the server connections. Sessions are tracked: the ones garbage collected or still
+      open when their driver is closed are reported, with the code that opened them, and closed.
+    """
+
+    def __init__(self):
+        self.drivers = {}
+        self._references = {}
+        self._sessions = {}
+        self._session_ids = itertools.count()
+        self._lock = threading.RLock()
+        atexit.register(self.close_all)
+
+    def acquire(self, uri, auth, config: dict, database=None) -> SharedDriver:
+        key = (uri, auth[0] if auth else None, database)
+        with self._lock:
+            if key not in self.drivers:
+                self.drivers[key] = GraphDatabase.driver(uri, auth=auth, **config)
+                self._references[key] = 0
+                self._sessions[key] = {}
+            self._references[key] += 1
+        return SharedDriver(self, key)
+
+    def session(self, key: tuple, **config) -> TrackedSession:
+        origin = "".join(traceback.format_stack(limit=4)[:-2])
+        with self._lock:
+            session_id = next(self._session_ids)
+            self._sessions[key][session_id] = origin
+        return TrackedSession(self, key, session_id, self.drivers[key].session(**config), origin)
+
+    def closed(self, key: tuple, session_id: int):
+        with self._lock:
+            self._sessions.get(key, {}).pop(session_id, None)
+
+    def leaked(self, key: tuple, session_id: int, session, origin: str):
+        """Called when a session is garbage collected without being closed"""
+        with self._lock:
+            reported = session_id not in self._sessions.get(key, {})
+            self._sessions.get(key, {}).pop(session_id, None)
+        if not reported:
+            print(f"session leaked (garbage collected without close), opened at:\n{origin}")
+        session.close()
+
+    def open_sessions(self) -> dict:
+        """The number of sessions still open for every driver key"""
+        with self._lock:
+            return {key: len(sessions) for key, sessions in self._sessions.items()}
+
+    def release(self, key: tuple):
+        with self._lock:
+            if key not in self._references:
+                return
+            self._references[key] -= 1
+            if self._references[key] > 0:
+                return
+            driver = self.drivers.pop(key)
+            del self._references[key]
+            sessions = self._sessions.pop(key)
+        for origin in sessions.values():
+            print(f"session leaked (still open when its driver was closed), opened at:\n{origin}")
+        driver.close()
+
+    def close_all(self):
+        with self._lock:
+            keys = list(self.drivers)
+        for key in keys:
+            with self._lock:
+                if key in self._references:
+                    self._references[key] = 1
+            self.release(key)
+
+
+drivers = DriverRegistry()
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from util.metrics import COUNTERS
+from util.payload import payload_size
+
+
+def _key(query: str, parameters: dict) -> str:
+    return hashlib.sha1(f"{query}\n{json.dumps(parameters, sort_keys=True, default=str)}".encode()).hexdigest()
+
+
+def _plain(value):
+    # nodes and relationships are recorded as their properties
+    if hasattr(value, "items") and not isinstance(value, dict):
+        return dict(value.items())
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    return value
+
+
+class ReplayRecord(dict):
+    """A recorded record, supporting the Record accessors used by the importers"""
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return super().__getitem__(key)
+
+    def data(self):
+        return dict(self)
+
+    def value(self, key=0, default=None):
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+
+class ReplayResult:
+    """A Result over recorded records"""
+
+    def __init__(self, records: list, counters: dict = None, plan: dict = None):
+        self._records = [ReplayRecord(record) for record in records]
+        counters = {**dict.fromkeys(COUNTERS, 0), **(counters or {})}
+        self._summary = SimpleNamespace(counters=SimpleNamespace(**counters), plan=plan)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def keys(self):
+        return list(self._records[0].keys()) if self._records else []
+
+    def single(self, strict=False):
+        return self._records[0] if self._records else None
+
+    def peek(self):
+        return self.single()
+
+    def data(self, *keys):
+        return [record.data() for record in self._records]
+
+    def value(self, key=0, default=None):
+        return [record.value(key, default) for record in self._records]
+
+    def values(self, *keys):
+        return [list(record.values()) for record in self._records]
+
+    def consume(self):
+        return self._summary
+
+
+class Recorder:
+    """
+    The journal of a fake driver
+      Every query run is appended to `queries.jsonl` with its parameters payload size, the number of
+      records it returned and the client time elapsed since the previous query (the time the importer spent
+      parsing, running NLP, building the batch, ...). The records returned by the server, when recording,
+      are appended to `reads.jsonl` and replayed in the same order for the same query and parameters.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._reads = {}
+        reads = self.directory / "reads.jsonl"
+        if reads.is_file():
+            with reads.open(encoding="utf-8") as f:
+                for line in f:
+                    read = json.loads(line)
+                    self._reads.setdefault(read["key"], []).append(read["records"])
+        self._replayed = {}
+        self._lock = threading.Lock()
+        self._last = time.perf_counter()
+        self._journal = (self.directory / "queries.jsonl").open("w", encoding="utf-8")
+        self._reads_file = None
+        self.totals = {}
+
+    def log(self, query: str, parameters: dict, records: int):
+        now = time.perf_counter()
+        with self._lock:
+            elapsed, self._last = now - self._last, now
+            query_id = hashlib.sha1(query.encode()).hexdigest()[:12]
+            size = payload_size(parameters)
+            totals = self.totals.setdefault(query_id, {"query": query, "runs": 0, "payload_bytes": 0,
+                                                       "client_seconds": 0.0})
+            totals["runs"] += 1
+            totals["payload_bytes"] += size
+            totals["client_seconds"] += elapsed
+            self._journal.write(json.dumps({"time": time.time(), "query": query_id, "payload_bytes": size,
+                                            "records": records, "client_seconds": elapsed}) + "\n")
+
+    def record(self, query: str, parameters: dict, records: list):
+        with self._lock:
+            if self._reads_file is None:
+                self._reads_file = (self.directory / "reads.jsonl").open("w", encoding="utf-8")
+            self._reads_file.write(json.dumps({"key": _key(query, parameters), "query": query,
+                                               "records": records}, default=str) + "\n")
+
+    def replay(self, query: str, parameters: dict) -> list:
+        key = _key(query, parameters)
+        with self._lock:
+            recorded = self._reads.get(key)
+            if not recorded:
+                return []
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+            return recorded[min(index, len(recorded) - 1)]
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
+            if self._reads_file is not None:
+                self._reads_file.close()
+        with (self.directory / "summary.json").open("w", encoding="utf-8") as f:
+            json.dump(self.totals, f, indent=2)
+
+
+class FakeTransaction:
+    def __init__(self, session: "FakeSession", tx=None):
+        self._session = session
+        self._tx = tx
+
+    def run(self, query: str, parameters: dict = None, **kwargs):
+        return self._session.run_in(self._tx, query, parameters, **kwargs)
+
+    def commit(self):
+        if self._tx is not None:
+            self._tx.commit()
+
+    def rollback(self):
+        if self._tx is not None:
+            self._tx.rollback()
+
+    def close(self):
+        if self._tx is not None:
+            self._tx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class FakeSession:
+    """Session of a FakeDriver: every query is journaled, and either run on the server or replayed"""
+
+    def __init__(self, recorder: Recorder, session=None):
+        self._recorder = recorder
+        self._session = session
+
+    def run_in(self, runner, query: str, parameters: dict = None, **kwargs):
+        parameters = {**(parameters or {}), **kwargs}
+        if runner is None:
+            records = self._recorder.replay(query, parameters)
+            counters, plan = None, None
+        else:
+            result = runner.run(query, parameters)
+            records = [_plain(record.data()) for record in result]
+            summary = result.consume()
+            counters = {name: getattr(summary.counters, name, 0) for name in COUNTERS}
+            plan = summary.plan
+            if records:
+                self._recorder.record(query, parameters, records)
+        self._recorder.log(query, parameters, len(records))
+        return ReplayResult(records, counters, plan)
+
+    def run(self, query: str, parameters: dict = None, **kwargs):
+        return self.run_in(self._session, query, parameters, **kwargs)
+
+    def begin_transaction(self, **kwargs):
+        tx = self._session.begin_transaction(**kwargs) if self._session is not None else None
+        return FakeTransaction(self, tx)
+
+    def _execute(self, method: str, work, *args, **kwargs):
+        if self._session is None:
+            return work(FakeTransaction(self), *args, **kwargs)
+        execute = getattr(self._session, method, None) or getattr(self._session, method.replace("execute_", "") +
+                                                                  "_transaction")  # neo4j 4.4
+        return execute(lambda tx: work(FakeTransaction(self, tx), *args, **kwargs))
+
+    def execute_write(self, work, *args, **kwargs):
+        return self._execute("execute_write", work, *args, **kwargs)
+
+    def execute_read(self, work, *args, **kwargs):
+        return self._execute("execute_read", work, *args, **kwargs)
+
+    write_transaction = execute_write
+    read_transaction = execute_read
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class FakeDriver:
+    """
+    Stand-in for a driver, to measure the client side cost of an importer apart from the database
+      With a real driver it records: queries run on the server and their results are saved to directory.
+      Without one it replays: writes are only journaled, reads return the records saved while recording
+      (or nothing), so any importer runs as a pure client throughput benchmark on a machine with no Neo4j.
+      Enable it with `fake_driver = record` or `fake_driver = replay` in the [neo4j] section of config.ini,
+      or with the NEO4J_FAKE_DRIVER environment variable. The async strategy always needs a server.
+    :param directory: where queries.jsonl, reads.jsonl and summary.json are stored
+    :param driver: the driver to record, None to replay
+    """
+
+    def __init__(self, directory, driver=None):
+        self._driver = driver
+        self.recorder = Recorder(directory)
+
+    def session(self, **config):
+        return FakeSession(self.recorder, self._driver.session(**config) if self._driver is not None else None)
+
+    def verify_connectivity(self, **config):
+        if self._driver is not None:
+            return self._driver.verify_connectivity(**config)
+        return "Neo4j/5-replay"
+
+    def close(self):
+        self.recorder.close()
+        if self._driver is not None:
+            self._driver.close()
+        print(f"driver journal saved to {self.recorder.directory}")
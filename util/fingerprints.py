@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable
+
+
+def row_hash(row) -> bytes:
+    return hashlib.blake2b(json.dumps(row, sort_keys=True, default=str).encode(), digest_size=16).digest()
+
+
+class FingerprintStore:
+    """
+    SQLite file recording a hash of the last row committed for every natural key of an import
+      Rows are grouped in scopes (importer and query), a run marks every key it reads so that the keys
+      missing from the input, that is removed from the source since the previous run, can be reported.
+    :param path: the SQLite file
+    """
+
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # shared by the writer threads of the parallel strategy
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            scope TEXT NOT NULL, key TEXT NOT NULL, hash BLOB, run INTEGER NOT NULL, PRIMARY KEY (scope, key)
+        ) WITHOUT ROWID""")
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def hashes(self, scope: str, keys: list) -> dict:
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            return dict(self._connection.execute(
+                f"SELECT key, hash FROM fingerprints WHERE scope = ? AND key IN ({placeholders})", [scope, *keys]))
+
+    def seen(self, scope: str, keys: list, run: int):
+        with self._lock:
+            self._connection.executemany("""
+            INSERT INTO fingerprints (scope, key, hash, run) VALUES (?, ?, NULL, ?)
+            ON CONFLICT (scope, key) DO UPDATE SET run = excluded.run""", [(scope, key, run) for key in keys])
+            self._connection.commit()
+
+    def commit(self, scope: str, hashes: list, run: int):
+        """Record the (key, hash) of committed rows"""
+        with self._lock:
+            self._connection.executemany("""
+            INSERT INTO fingerprints (scope, key, hash, run) VALUES (?, ?, ?, ?)
+            ON CONFLICT (scope, key) DO UPDATE SET hash = excluded.hash, run = excluded.run""",
+                                         [(scope, key, value, run) for key, value in hashes])
+            self._connection.commit()
+
+    def removed(self, scope: str, run: int) -> list:
+        """The keys of scope not read by run, that are dropped from the store"""
+        with self._lock:
+            keys = [key for key, in self._connection.execute(
+                "SELECT key FROM fingerprints WHERE scope = ? AND run < ?", (scope, run))]
+            self._connection.execute("DELETE FROM fingerprints WHERE scope = ? AND run < ?", (scope, run))
+            self._connection.commit()
+        return keys
+
+    def close(self):
+        self._connection.close()
+
+
+class IncrementalRun:
+    """
+    A batch_store run sending only the rows that are new or changed since the previous run
+      Rows are hashed and compared with the store in chunks, the hashes of the rows sent are recorded only
+      once their batch is committed, so a failed run sends them again. Rows sent to the dead-letter file
+      are not recorded either.
+    :param store: the FingerprintStore
+    :param scope: the scope of the keys, e.g. importer and query
+    :param key: function returning the natural key of a row
+    """
+
+    def __init__(self, store: FingerprintStore, scope: str, key: Callable):
+        self.store = store
+        self.scope = scope
+        self.key = key
+        self.run = time.time_ns()
+        self.read = 0
+        self.sent = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def changed(self, rows: Iterable, chunk_size: int = 500):
+        """The new or changed rows of rows"""
+        rows = iter(rows)
+        for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+            keys = [str(self.key(row)) for row in chunk]
+            stored = self.store.hashes(self.scope, list(set(keys)))
+            self.store.seen(self.scope, keys, self.run)
+            self.read += len(chunk)
+            for row, key in zip(chunk, keys):
+                value = row_hash(row)
+                if stored.get(key) == value:
+                    continue
+                with self._lock:
+                    self._pending[id(row)] = (key, value)
+                self.sent += 1
+                yield row
+
+    def failed(self, rows: list):
+        with self._lock:
+            for row in rows:
+                self._pending.pop(id(row), None)
+
+    def committed(self, batch: list):
+        with self._lock:
+            hashes = [entry for entry in (self._pending.pop(id(row), None) for row in batch) if entry is not None]
+        self.store.commit(self.scope, hashes, self.run)
+
+    def report_removed(self, path) -> int:
+        """Append the keys removed from the source to path and return how many they are"""
+        removed = self.store.removed(self.scope, self.run)
+        if removed:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                for key in removed:
+                    f.write(json.dumps({"time": time.time(), "scope": self.scope, "key": key}) + "\n")
+        return len(removed)
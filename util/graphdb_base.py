@@ -1,10 +1,14 @@
-from neo4j import GraphDatabase
 import configparser
 import os
 import sys
 import getopt
 
-help_message = '-u <neo4j username> -p <password> -s <source directory> -b <bolt uri>'
+from util.driver_registry import drivers
+from util.fake_driver import FakeDriver
+from util.profiler import ProfilingDriver, QueryProfiler
+
+help_message = '-u <neo4j username> -p <password> -s <source directory> -b <bolt uri> -e <bulk export directory> ' \
+               '--incremental'
 
 neo4j_user = 'neo4j'
 neo4j_password = 'password'
@@ -21,6 +25,8 @@ class GraphDBBase:
         self.neo4j_password = None
         self.source_dataset_path = None
         self.database = None
+        self.export_dir = None
+        self.incremental = False
         self.opts = {}
         self.args = []
 
@@ -37,8 +43,21 @@ class GraphDBBase:
         user = self.neo4j_user or os.getenv('NEO4J_USER') or neo4j_params.get('user', 'neo4j')
         password = self.neo4j_password or os.getenv('NEO4J_PASSWORD') or neo4j_params.get('password', 'password')
         self.database = self.database or os.getenv('NEO4J_DATABASE') or neo4j_params.get('database', 'neo4j')
-        ignored_params = {'uri', 'user', 'password'}
-        param_converters = {'encrypted': lambda x: int(x)}
+        self.fake_driver = os.getenv('NEO4J_FAKE_DRIVER') or neo4j_params.get('fake_driver')
+        self.fake_driver_dir = os.getenv('NEO4J_FAKE_DRIVER_DIR') or neo4j_params.get(
+            'fake_driver_dir', os.path.join(os.path.dirname(__file__), '..', '.recordings'))
+        # fraction of the executions of the named queries run under PROFILE, see util.profiler
+        profile_rate = float(os.getenv('NEO4J_PROFILE') or neo4j_params.get('profile', 0))
+        self.profiler = QueryProfiler(type(self).__name__, profile_rate) if profile_rate > 0 else None
+        self.profile_dir = os.path.join(os.path.dirname(__file__), '..', '.profiles')
+        ignored_params = {'uri', 'user', 'password', 'database', 'fake_driver', 'fake_driver_dir', 'profile'}
+        param_converters = {'encrypted': lambda x: int(x),
+                            'max_transaction_retry_time': lambda x: float(x),
+                            'max_connection_pool_size': lambda x: int(x),
+                            'connection_acquisition_timeout': lambda x: float(x),
+                            'connection_timeout': lambda x: float(x),
+                            'max_connection_lifetime': lambda x: float(x),
+                            'fetch_size': lambda x: int(x)}
 
         def maybe_convert(key: str, value: str):
             if key in param_converters:
@@ -49,9 +68,33 @@ class GraphDBBase:
                              if key not in ignored_params])
         # print(other_params)
 
-        self._driver = GraphDatabase.driver(uri, auth=(user, password), **other_params)
+        self._connection = (uri, (user, password), other_params)
+        self._driver = self.create_driver(uri, (user, password), other_params)
         self._session = None
 
+    def create_driver(self, uri, auth, config: dict):
+        if self.fake_driver == 'replay':
+            driver = FakeDriver(os.path.join(self.fake_driver_dir, type(self).__name__))
+        else:
+            # drivers are shared by all the instances connecting to the same server, see util.driver_registry
+            driver = drivers.acquire(uri, auth, config, self.database)
+            if self.fake_driver == 'record':
+                driver = FakeDriver(os.path.join(self.fake_driver_dir, type(self).__name__), driver)
+        # replayed runs have no plans to profile
+        if self.profiler is not None and self.fake_driver != 'replay':
+            return ProfilingDriver(driver, self.profiler)
+        return driver
+
+    def named(self, name: str, query: str) -> str:
+        """
+        Name query in the profiles, only named queries are profiled (see util.profiler)
+        :param name: the name of the query in the profile reports
+        :param query: the query
+        """
+        if self.profiler is not None:
+            self.profiler.name(query, name)
+        return query
+
     def get_opts(self):
         return self.opts
 
@@ -63,6 +106,10 @@ class GraphDBBase:
         return default
 
     def close(self):
+        if self.profiler:
+            path = self.profiler.save(self.profile_dir)
+            print(self.profiler.report(self.profile_dir))
+            print(f"query profiles saved to {path}")
         self._driver.close()
 
     def get_session(self):
@@ -70,7 +117,8 @@ class GraphDBBase:
 
     def execute_without_exception(self, query: str):
         try:
-            self.get_session().run(query)
+            with self.get_session() as session:
+                session.run(query)
         except Exception as e:
             pass
 
@@ -82,9 +130,9 @@ class GraphDBBase:
 
     def __get_main_parameters__(self, command, argv, extended_options='', extended_long_options=[]):
         try:
-            self.opts, self.args = getopt.getopt(argv, 'hu:p:s:b:d:' + extended_options,
+            self.opts, self.args = getopt.getopt(argv, 'hu:p:s:b:d:e:' + extended_options,
                                        ['help', 'neo4j-user=', 'neo4j-password=', 'source-path=',
-                                        'bolt=', 'database='] + extended_long_options)
+                                        'bolt=', 'database=', 'export-dir=', 'incremental'] + extended_long_options)
         except getopt.GetoptError as e:
             print(e)
             print(command, help_message)
@@ -103,3 +151,7 @@ class GraphDBBase:
                 self.uri = arg
             elif opt in ("-d", "--database"):
                 self.database = arg
+            elif opt in ("-e", "--export-dir"):
+                self.export_dir = arg
+            elif opt == "--incremental":
+                self.incremental = True
@@ -0,0 +1,76 @@
+class KeysetReader:
+    """
+    Stream the nodes of a label in pages of `fetch_size` nodes, ordered by a unique and indexed key
+      Every page is read in its own short read transaction, seeking the index from the last key of the previous
+      page (keyset pagination) instead of skipping rows, so the reader never holds a transaction open over the
+      whole graph, only a page is in memory at once, and the nodes written or relabeled by the import (e.g. marked
+      NEDProcessed) while it reads are neither skipped nor read twice.
+    For every page query runs with `n` bound to each node of the page, its records are yielded as dicts:
+        pages = KeysetReader(importer, "Page", "id", where="NOT n:NEDProcessed",
+                             query="RETURN n.id AS id, n.text AS text")
+        importer.batch_store(upload_query, pages, size=pages.count())
+    :param importer: the importer whose driver and database are read
+    :param label: the label of the nodes to page through
+    :param key: the unique key of label, it should be backed by a uniqueness constraint or an index
+    :param where: optional predicate on n selecting the nodes to read
+    :param query: the Cypher run on the nodes of every page, by default returning their properties
+    :param fetch_size: the number of nodes per page
+    """
+
+    def __init__(self, importer, label: str, key: str, where: str = None, query: str = "RETURN n {.*} AS node",
+                 fetch_size: int = 1000):
+        self.importer = importer
+        self.label = label
+        self.key = key
+        self.where = where
+        self.query = query
+        self.fetch_size = fetch_size
+
+    def keys_query(self, first: bool):
+        condition = f"n.`{self.key}` IS NOT NULL" if first else f"n.`{self.key}` > $after"
+        if self.where:
+            condition = f"{condition} AND ({self.where})"
+        return f"""
+        MATCH (n:`{self.label}`)
+        WHERE {condition}
+        RETURN n.`{self.key}` AS key
+        ORDER BY key
+        LIMIT $fetch_size
+        """
+
+    def page_query(self):
+        return f"""
+        UNWIND $keys AS key
+        MATCH (n:`{self.label}` {{`{self.key}`: key}})
+        {self.query}
+        """
+
+    def read(self, session, query: str, parameters: dict) -> list:
+        # a managed read transaction per page, retried by the driver on transient errors
+        execute_read = getattr(session, "execute_read", None) or session.read_transaction  # neo4j 4.4
+        return execute_read(lambda tx: [dict(record) for record in tx.run(query, parameters)])
+
+    def pages(self):
+        """The records of the query, a list per page"""
+        after = None
+        with self.importer._driver.session(database=self.importer._database) as session:
+            while True:
+                keys = [record["key"] for record in
+                        self.read(session, self.keys_query(after is None),
+                                  {"after": after, "fetch_size": self.fetch_size})]
+                if not keys:
+                    return
+                yield self.read(session, self.page_query(), {"keys": keys})
+                if len(keys) < self.fetch_size:
+                    return
+                after = keys[-1]
+
+    def __iter__(self):
+        for page in self.pages():
+            yield from page
+
+    def count(self):
+        """The number of nodes to read"""
+        where = f"WHERE {self.where}" if self.where else ""
+        with self.importer._driver.session(database=self.importer._database) as session:
+            return session.run(f"MATCH (n:`{self.label}`) {where} RETURN count(n) AS count").single()["count"]
@@ -0,0 +1,134 @@
+import io
+import json
+import mmap
+import os
+from pathlib import Path
+
+from util.checkpoint import fingerprint
+from util.decompress import DecompressingReader, compression
+
+
+class LineIndex:
+    """
+    Sparse index of the lines of a large line oriented file (TSV, RRF, ...), to split it in byte ranges
+    aligned to line boundaries that are parsed in parallel
+      The file is scanned once through mmap: every block_size bytes the index records the number of the next
+      line and its offset, and it keeps the exact number of lines. It is cached next to the file as
+      `<file>.lines.json` and built again when the file changes. Lines must not span quoted newlines.
+    :param path: the file, uncompressed
+    :param block_size: the distance in bytes between the indexed lines, i.e. the granularity of the ranges
+    """
+
+    def __init__(self, path, block_size: int = 1024 * 1024):
+        self.path = Path(path)
+        self.cache = self.path.with_name(self.path.name + ".lines.json")
+        index = self.load()
+        if index is None or index["block_size"] != block_size:
+            index = self.build(block_size)
+            self.save(index)
+        self.size = index["size"]
+        self.lines = index["lines"]
+        # (line number, offset) of the first line starting after every block
+        self.marks = [tuple(mark) for mark in index["marks"]]
+
+    def load(self):
+        try:
+            with self.cache.open(encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index if index.get("source") == fingerprint(self.path) else None
+
+    def save(self, index: dict):
+        try:
+            with self.cache.open("w", encoding="utf-8") as f:
+                json.dump(index, f)
+        except OSError:
+            # read only datasets are indexed again on every run
+            pass
+
+    def build(self, block_size: int) -> dict:
+        size = os.path.getsize(self.path)
+        marks, lines = [(0, 0)], 0
+        if size:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                start = 0
+                while start < size:
+                    end = data.find(b"\n", min(start + block_size, size) - 1)
+                    end = size if end < 0 else end + 1
+                    lines += data[start:end].count(b"\n")
+                    if end < size:
+                        marks.append((lines, end))
+                    start = end
+                if data[size - 1:size] != b"\n":
+                    lines += 1
+        return {"source": fingerprint(self.path), "size": size, "lines": lines, "block_size": block_size,
+                "marks": marks}
+
+    def __len__(self):
+        return self.lines
+
+    def ranges(self, skip: int = 0, range_bytes: int = 4 * 1024 * 1024) -> list:
+        """
+        Split the file in ranges of about range_bytes, aligned to line boundaries
+        :param skip: the number of lines skipped at the beginning of the file, e.g. 1 for a header
+        :param range_bytes: the approximate size of every range
+        :return: a list of (start offset, end offset, number of the first line)
+        """
+        start, first = self.offset(skip), skip
+        ranges = []
+        for line, offset in self.marks[1:] + [(self.lines, self.size)]:
+            if offset <= start:
+                continue
+            if offset - start >= range_bytes or offset == self.size:
+                ranges.append((start, offset, first))
+                start, first = offset, line
+        return ranges
+
+    def offset(self, line: int) -> int:
+        """The offset of line, found scanning from the closest indexed line"""
+        mark, offset = max((mark for mark in self.marks if mark[0] <= line), default=(0, 0))
+        if mark == line:
+            return offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for _ in range(line - mark):
+                if not f.readline():
+                    break
+            return f.tell()
+
+
+def read_range(path, start: int, end: int, encoding: str = "utf-8") -> io.StringIO:
+    """The lines between the offsets start and end of path, as a text stream read like open(path, newline='')"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return io.StringIO(data[start:end].decode(encoding), newline="")
+
+
+def first_line(path, encoding: str = "utf-8") -> str:
+    """The first line of path, plain or compressed, without its line ending"""
+    raw = open(path, "rb", buffering=0)
+    kind = compression(raw)
+    with io.BufferedReader(DecompressingReader(raw, kind) if kind is not None else raw) as stream:
+        return stream.readline().decode(encoding).rstrip("\r\n")
+
+
+def range_parser(parse, parse_args: tuple, encoding: str):
+    return parse, parse_args, encoding
+
+
+def parse_range(state: tuple, item: tuple) -> list:
+    """The rows parsed from a range of a file, run by the worker processes"""
+    parse, parse_args, encoding = state
+    path, start, end = item
+    return list(parse(read_range(path, start, end, encoding), *parse_args))
+
+
+class RangeProgress:
+    """The bytes of the ranges parsed so far, tracked by ImportProgress like the position of an input file"""
+
+    def __init__(self):
+        self.position = 0
+        self.closed = False
+
+    def tell(self):
+        return self.position
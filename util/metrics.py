@@ -0,0 +1,197 @@
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from pathlib import Path
+
+COUNTERS = ["nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted", "properties_set",
+            "labels_added", "labels_removed", "indexes_added", "indexes_removed", "constraints_added",
+            "constraints_removed"]
+
+QUANTILES = [0.5, 0.9, 0.95, 0.99]
+
+
+def counters_dict(counters) -> dict:
+    """The SummaryCounters of a result (as returned by `result.consume().counters`) as a dict"""
+    if counters is None:
+        return {}
+    return {name: getattr(counters, name, 0) for name in COUNTERS}
+
+
+def percentile(values: list, quantile: float):
+    """Nearest-rank percentile of values, that must be sorted"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(quantile * len(values)) - 1))]
+
+
+class QueryMetrics:
+    """Totals and batch latencies of the writes of a single query"""
+
+    def __init__(self, query: str, desc=""):
+        self.query = query
+        self.id = hashlib.sha1(query.encode()).hexdigest()[:12]
+        self.desc = desc
+        self.batches = 0
+        self.rows = 0
+        self.failed_rows = 0
+        self.payload_bytes = 0
+        self.latencies = []
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        # the seconds of the batch_store calls already ended and the (start, end) of the current one
+        self.seconds = 0.0
+        self._call = None
+
+    def begin(self):
+        """Start timing a new batch_store call, the time between calls is not counted"""
+        if self._call is not None:
+            self.seconds += self._call[1] - self._call[0]
+            self._call = None
+
+    def record(self, rows: int, latency: float, payload_bytes: int = 0, counters: dict = None):
+        now = time.time()
+        if self._call is None:
+            self._call = [now - latency, now]
+        self._call[1] = now
+        self.batches += 1
+        self.rows += rows
+        self.payload_bytes += payload_bytes
+        self.latencies.append(latency)
+        for name, value in (counters or {}).items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def elapsed(self):
+        return self.seconds + (self._call[1] - self._call[0] if self._call is not None else 0.0)
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        elapsed = self.elapsed()
+        return {
+            "query": self.query,
+            "id": self.id,
+            "desc": self.desc,
+            "batches": self.batches,
+            "rows": self.rows,
+            "failed_rows": self.failed_rows,
+            "payload_bytes": self.payload_bytes,
+            "seconds": elapsed,
+            "rows_per_second": self.rows / elapsed if elapsed > 0 else None,
+            "latency": {"sum": sum(latencies), "mean": sum(latencies) / len(latencies) if latencies else None,
+                        "max": latencies[-1] if latencies else None,
+                        **{f"p{int(q * 100)}": percentile(latencies, q) for q in QUANTILES}},
+            "counters": self.counters,
+        }
+
+
+class ImportMetrics:
+    """
+    Collects the per batch measures of an importer: rows, payload bytes, commit latency and the
+    server side counters (nodes and relationships created, properties set, ...), grouped by query
+      The totals are saved as a JSON summary and as a Prometheus text file (e.g. for the node exporter
+      textfile collector), so that runs can be compared and a MERGE getting slower shows up in the latencies.
+      The measures are grouped by query and description of the batch_store call, calls with the same ones
+      (e.g. the same query run over several files) add up, timed only while they run.
+    """
+
+    def __init__(self, importer: str):
+        self.importer = importer
+        self.started = time.time()
+        self._queries = {}
+        self._descriptions = {}
+        self._lock = threading.Lock()
+
+    def _get(self, query: str) -> QueryMetrics:
+        desc = self._descriptions.get(query, "")
+        if (query, desc) not in self._queries:
+            self._queries[query, desc] = QueryMetrics(query, desc)
+        return self._queries[query, desc]
+
+    def describe(self, query: str, desc: str):
+        """Start a batch_store call of query, whose batches are recorded under its progress description"""
+        with self._lock:
+            self._descriptions[query] = desc or ""
+            self._get(query).begin()
+
+    def record(self, query: str, rows: int, latency: float, payload_bytes: int = 0, counters: dict = None):
+        with self._lock:
+            self._get(query).record(rows, latency, payload_bytes, counters)
+
+    def failed(self, query: str, rows: int):
+        with self._lock:
+            self._get(query).failed_rows += rows
+
+    def __bool__(self):
+        return bool(self._queries)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {"importer": self.importer, "started": self.started, "finished": time.time(),
+                    "queries": [metrics.summary() for metrics in self._queries.values()]}
+
+    def report(self):
+        """A short human readable report, one line per query"""
+        lines = []
+        for query in self.summary()["queries"]:
+            if not query["batches"]:
+                continue
+            name = query["desc"] or query["id"]
+            rate = f"{query['rows_per_second']:.0f}" if query["rows_per_second"] else "-"
+            p50, p99 = query["latency"]["p50"], query["latency"]["p99"]
+            lines.append(f"{name}: {query['rows']} rows in {query['seconds']:.1f}s ({rate} rows/s), "
+                         f"batch latency p50 {p50:.3f}s p99 {p99:.3f}s, "
+                         f"{query['counters']['nodes_created']} nodes and "
+                         f"{query['counters']['relationships_created']} relationships created")
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, description, samples):
+            lines.append(f"# HELP kg_import_{name} {description}")
+            lines.append(f"# TYPE kg_import_{name} {kind}")
+            for suffix, labels, value in samples:
+                if value is None:
+                    continue
+                labels = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+                lines.append(f"kg_import_{name}{suffix}{{{labels}}} {value}")
+
+        queries = self.summary()["queries"]
+        labels = [{"importer": self.importer, "query": q["id"], "desc": q["desc"]} for q in queries]
+        metric("batch_latency_seconds", "summary", "Seconds taken to commit a batch",
+               [("", {**label, "quantile": str(quantile)}, q["latency"][f"p{int(quantile * 100)}"])
+                for q, label in zip(queries, labels) for quantile in QUANTILES] +
+               [(suffix, label, value) for q, label in zip(queries, labels)
+                for suffix, value in (("_sum", q["latency"]["sum"]), ("_count", q["batches"]))])
+        metric("rows_total", "counter", "Rows written",
+               [("", label, q["rows"]) for q, label in zip(queries, labels)])
+        metric("failed_rows_total", "counter", "Rows sent to the dead-letter file",
+               [("", label, q["failed_rows"]) for q, label in zip(queries, labels)])
+        metric("payload_bytes_total", "counter", "Estimated bytes of the batch parameters sent to the server",
+               [("", label, q["payload_bytes"]) for q, label in zip(queries, labels)])
+        metric("rows_per_second", "gauge", "Rows written per second of wall clock time",
+               [("", label, q["rows_per_second"]) for q, label in zip(queries, labels)])
+        for counter in COUNTERS:
+            metric(f"{counter}_total", "counter", f"Server side {counter.replace('_', ' ')} counter",
+                   [("", label, q["counters"].get(counter, 0)) for q, label in zip(queries, labels)])
+        return "\n".join(lines) + "\n"
+
+    def save(self, directory) -> Path:
+        """
+        Write `<importer>.json` and `<importer>.prom` to directory, returns the JSON file
+          The summary of the previous run is kept as `<importer>.previous.json`, to compare the two runs.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{self.importer}.json"
+        if path.is_file():
+            path.replace(directory / f"{self.importer}.previous.json")
+        path.write_text(json.dumps(self.summary(), indent=2))
+        (directory / f"{self.importer}.prom").write_text(self.prometheus())
+        return path
+
+
+def _escape(value: str) -> str:
+    return re.sub(r'(["\\])', r"\\\1", str(value)).replace("\n", "\\n")
@@ -0,0 +1,96 @@
+from collections import defaultdict
+from typing import Iterable
+
+
+def jaro_winkler(first: str, second: str) -> float:
+    """
+    Jaro-Winkler similarity of two strings, 1 when they are equal
+      As computed by apoc.text.jaroWinklerDistance: the prefix bonus (0.1 per common leading character,
+      up to 4) is added only when the Jaro similarity reaches 0.7.
+    """
+    if first == second:
+        return 1.0
+    shorter, longer = (first, second) if len(first) <= len(second) else (second, first)
+    window = max(len(longer) // 2 - 1, 0)
+    matched = [False] * len(longer)
+    shorter_matches = []
+    for i, char in enumerate(shorter):
+        for j in range(max(i - window, 0), min(i + window + 1, len(longer))):
+            if not matched[j] and longer[j] == char:
+                matched[j] = True
+                shorter_matches.append(char)
+                break
+    matches = len(shorter_matches)
+    if not matches:
+        return 0.0
+    longer_matches = (char for char, flag in zip(longer, matched) if flag)
+    transpositions = sum(a != b for a, b in zip(shorter_matches, longer_matches)) // 2
+    jaro = (matches / len(first) + matches / len(second) + (matches - transpositions) / matches) / 3
+    if jaro < 0.7:
+        return jaro
+    prefix = 0
+    for a, b in zip(first[:4], second[:4]):
+        if a != b:
+            break
+        prefix += 1
+    return jaro + 0.1 * prefix * (1 - jaro)
+
+
+class NameMatcher:
+    """
+    Fuzzy matching of free text names (e.g. the diseases of dbDEMC) against a dictionary of names, client side
+      A name matches an entry when they are equal, or when they have the same number of tokens, all the tokens
+      of the entry are tokens of the name and, with a threshold, their Jaro-Winkler similarity is above it.
+      Such names and entries have the same distinct tokens, so only the entries holding the least common token
+      of the name, found through an inverted index of the tokens, are compared to it instead of the whole
+      dictionary. Names and entries are compared lower cased.
+        matcher = NameMatcher(session.run("MATCH (d:Disease) RETURN d.id AS key, d.name AS name").values(), 0.9)
+        matcher.match("lymphocytic leukemia")
+    :param entries: (key, name) pairs, e.g. the unique keys and the names of nodes, a key can have several names
+    :param threshold: the minimum Jaro-Winkler similarity of name and entry, None to match on the tokens only
+    :param separator: the separator of the entries' tokens, by default any whitespace (the names' tokens are
+                      always split on whitespace)
+    """
+
+    def __init__(self, entries: Iterable, threshold: float = None, separator: str = None):
+        self.threshold = threshold
+        self.separator = separator
+        self._exact = defaultdict(set)
+        self._entries = []
+        self._index = defaultdict(list)
+        for key, name in entries:
+            self.add(key, name)
+
+    def add(self, key, name: str):
+        if not name:
+            return
+        name = name.lower().strip()
+        self._exact[name].add(key)
+        tokens = [token.strip() for token in name.split(self.separator)]
+        if len(set(tokens)) < len(tokens):
+            # a repeated token never matches, as in the Cypher version the intersection is distinct
+            return
+        position = len(self._entries)
+        self._entries.append((key, name, frozenset(tokens)))
+        for token in tokens:
+            self._index[token].append(position)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def candidates(self, tokens: list) -> list:
+        """The entries holding all the distinct tokens, looked up from the least common one"""
+        postings = [self._index.get(token, ()) for token in set(tokens)]
+        if len(set(tokens)) < len(tokens) or not postings:
+            return []
+        tokens = frozenset(tokens)
+        return [self._entries[i] for i in min(postings, key=len) if self._entries[i][2] == tokens]
+
+    def match(self, name: str) -> set:
+        """The keys of the entries matching name"""
+        name = name.lower().strip()
+        keys = set(self._exact.get(name, ()))
+        for key, entry, _ in self.candidates(name.split()):
+            if key not in keys and (self.threshold is None or jaro_winkler(name, entry) > self.threshold):
+                keys.add(key)
+        return keys
@@ -0,0 +1,141 @@
+import re
+
+
+def _header_size(length: int, tiny: bool = True):
+    if tiny and length < 16:
+        return 1
+    if length < 0x100:
+        return 2
+    if length < 0x10000:
+        return 3
+    return 5
+
+
+def _int_size(value: int):
+    if -0x10 <= value < 0x80:
+        return 1
+    if -0x80 <= value < 0x80:
+        return 2
+    if -0x8000 <= value < 0x8000:
+        return 3
+    if -0x80000000 <= value < 0x80000000:
+        return 5
+    return 9
+
+
+def payload_size(value):
+    """
+    Estimate the number of bytes `value` takes once serialized by the Bolt protocol (PackStream)
+      It is an estimate: the chunking overhead and the less common types (temporal, spatial, ...) are
+      approximated, but it is cheap enough to be computed on every batch.
+    """
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, int):
+        return _int_size(value)
+    if isinstance(value, float):
+        return 9
+    if isinstance(value, str):
+        length = len(value) if value.isascii() else len(value.encode("utf-8"))
+        return _header_size(length) + length
+    if isinstance(value, (bytes, bytearray)):
+        return _header_size(len(value), tiny=False) + len(value)
+    if isinstance(value, dict):
+        return _header_size(len(value)) + sum(payload_size(k) + payload_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return _header_size(len(value)) + sum(payload_size(v) for v in value)
+    return 16
+
+
+class ColumnarRows:
+    """
+    Rows held as parallel columns (lists or numpy arrays) of the same length, that a columnar batch_store sends
+    without building a dict per row: its batches are slices of the columns, turned into lists by to_columns.
+    Iterating them, or reading a single row, yields dicts, for the code that needs the rows (dead letters, dedup).
+        rows = ColumnarRows(source=names[i], destination=names[j], value=values)
+        self.batch_store(query, rows, size=len(rows), columnar=True)
+    :param columns: the columns, by field name
+    """
+
+    def __init__(self, **columns):
+        if len({len(column) for column in columns.values()}) > 1:
+            raise ValueError("the columns must have the same length")
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), ()))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ColumnarRows(**{name: column[index] for name, column in self.columns.items()})
+        return {name: _value(column[index]) for name, column in self.columns.items()}
+
+    def __iter__(self):
+        columns = self.lists()
+        return (dict(zip(columns, row)) for row in zip(*columns.values()))
+
+    def lists(self) -> dict:
+        """The columns as lists of Python values"""
+        return {name: column.tolist() if hasattr(column, "tolist") else list(column)
+                for name, column in self.columns.items()}
+
+    def batches(self, size: int):
+        for start in range(0, len(self), size):
+            yield self[start:start + size]
+
+
+def _value(value):
+    # numpy scalars are not serializable by the driver
+    return value.item() if hasattr(value, "item") else value
+
+
+def to_columns(rows: list) -> dict:
+    """
+    Turn a batch of dicts into a dict of parallel lists, so that every key is serialized once per batch
+    instead of once per row. Fields that are None in every row are dropped: the query reads them as null anyway.
+    """
+    if isinstance(rows, ColumnarRows):
+        return rows.lists()
+    columns = {}
+    for i, row in enumerate(rows):
+        for name, value in row.items():
+            if value is None:
+                continue
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = [None] * len(rows)
+            column[i] = value
+    return columns
+
+
+_UNWIND = re.compile(r"UNWIND\s+\$batch\s+AS\s+(\w+)", re.I)
+
+
+def columnar_query(query: str) -> str:
+    """
+    Rewrite a query reading `UNWIND $batch as item` rows into one reading the columns sent by to_columns:
+        UNWIND $batch as item
+        MERGE (n:Node {id: item.id})
+        WITH item, n
+        SET n.name = item.name
+    becomes
+        UNWIND range(0, $rows - 1) as item
+        MERGE (n:Node {id: $batch.id[item]})
+        WITH item, n
+        SET n.name = $batch.name[item]
+    Only property access (`item.x`, `item.x.y`) and carrying item through WITH are supported, any other use of
+    item raises a ValueError. Queries without `UNWIND $batch as item` are returned unchanged.
+    """
+    unwind = _UNWIND.search(query)
+    if unwind is None:
+        return query
+    variable = unwind.group(1)
+    body = query[unwind.end():]
+    # but for its properties item can only be projected as is by WITH, so that it still holds the row index
+    for use in re.finditer(rf"(?<![.$\w`]){variable}\b(?!\s*\.)", body):
+        before, after = body[:use.start()].rstrip(), body[use.end():]
+        projected = before.endswith(",") or re.search(r"\bWITH$", before, re.I)
+        if not projected or not re.match(r"[ \t]*(,|\n|$)", after):
+            raise ValueError(f"{variable} is used other than through its properties in\n{query.strip()}")
+    body = re.sub(rf"(?<![.$\w`]){variable}\.(`[^`]+`|\w+)", lambda m: f"$batch.{m.group(1)}[{variable}]", body)
+    return f"{query[:unwind.start()]}UNWIND range(0, $rows - 1) as {variable}{body}"
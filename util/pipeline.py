@@ -0,0 +1,68 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from multiprocessing import get_context
+from typing import Callable, Iterable
+
+# the state built by setup in each worker process, e.g. a loaded NLP model
+_state = None
+
+
+def _init_worker(setup: Callable, setup_args: tuple):
+    global _state
+    _state = setup(*setup_args) if setup is not None else None
+
+
+def _transform_chunk(transform: Callable, chunk: list):
+    return [row for row in (transform(_state, item) for item in chunk) if row is not None]
+
+
+def process_map(transform: Callable, items: Iterable, setup: Callable = None, setup_args: tuple = (),
+                processes: int = 1, chunk_size: int = 10, ordered: bool = True):
+    """
+    Transform items in a pool of worker processes, yielding the rows in the caller's process
+      items are read in the caller's process and sent to the workers in chunks of chunk_size, at most two chunks
+      per worker are in flight so reading the input never runs too far ahead of the consumer of the rows.
+      With processes <= 1 everything runs inline, in the same order.
+    :param transform: function(state, item) returning the row of item, or None to drop it. It must be picklable
+                      (a module level function or a staticmethod) as it is sent to the workers
+    :param items: the input to transform, e.g. the documents read from files
+    :param setup: optional function building the state of each worker (e.g. loading the NLP model) once per process
+    :param setup_args: the arguments of setup
+    :param processes: the number of worker processes
+    :param chunk_size: the number of items sent to a worker at once
+    :param ordered: yield the rows in the order of items, otherwise as soon as their chunk is done (faster when
+                    items take very different times, but not compatible with checkpoints)
+    """
+    items = iter(items)
+    if processes <= 1:
+        state = setup(*setup_args) if setup is not None else None
+        for item in items:
+            row = transform(state, item)
+            if row is not None:
+                yield row
+        return
+
+    # spawned rather than forked: the parent holds the driver connections and its threads
+    executor = ProcessPoolExecutor(processes, mp_context=get_context("spawn"), initializer=_init_worker,
+                                   initargs=(setup, setup_args))
+    pending = deque()
+    try:
+        for chunk in iter(lambda: list(islice(items, chunk_size)), []):
+            while len(pending) >= 2 * processes:
+                yield from _done(pending, ordered)
+            pending.append(executor.submit(_transform_chunk, transform, chunk))
+        while pending:
+            yield from _done(pending, ordered)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _done(pending: deque, ordered: bool):
+    """The rows of the oldest chunk, or of the first chunk done when not ordered"""
+    if ordered:
+        return pending.popleft().result()
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    future = next(iter(done))
+    pending.remove(future)
+    return future.result()
@@ -0,0 +1,85 @@
+import re
+
+def plan_operators(plan: dict):
+    """All the operators of a query plan (as returned by `result.consume().plan`), depth first"""
+    if not plan:
+        return
+    yield plan
+    for child in plan.get("children", []):
+        yield from plan_operators(child)
+
+
+def operator_type(operator: dict) -> str:
+    # e.g. "NodeByLabelScan@neo4j" on neo4j 5
+    return operator.get("operatorType", "").split("@")[0]
+
+
+def operator_details(operator: dict) -> str:
+    # Bolt sends the operator arguments as "args"
+    return str((operator.get("args") or operator.get("arguments") or {}).get("Details", ""))
+
+
+def scanned_label(operator: dict):
+    """The label of a NodeByLabelScan, whose details look like `n:Label`"""
+    match = re.search(r":`?([^`\s]+)`?", operator_details(operator))
+    return match.group(1) if match else None
+
+
+def index_seeks(plan: dict) -> set:
+    """The (label or relationship type, properties) of the index lookups of a query plan"""
+    seeks = set()
+    for operator in plan_operators(plan):
+        if "Index" not in operator_type(operator):
+            continue
+        details = operator_details(operator)
+        for target, properties in re.findall(r":`?(\w+)`?\(([^)]*)\)", details):
+            seeks.add((target, tuple(p.strip().strip("`") for p in properties.split(","))))
+    return seeks
+
+
+def scan_problem(session, operator: dict, large_label: int, counts: dict):
+    """
+    Describe operator when it scans all the nodes, or a label with more than large_label nodes, otherwise None
+    :param counts: the node counts of the labels already looked up, filled by this function
+    """
+    kind = operator_type(operator)
+    if kind == "AllNodesScan":
+        return kind
+    if kind != "NodeByLabelScan":
+        return None
+    label = scanned_label(operator)
+    if label is None:
+        return kind
+    if label not in counts:
+        counts[label] = session.run(f"MATCH (n:`{label}`) RETURN count(n) AS count").single()["count"]
+    return f"{kind} on {label} ({counts[label]} nodes)" if counts[label] > large_label else None
+
+
+def explain(session, query: str, parameters: dict, large_label: int = 100000) -> tuple:
+    """
+    Plan query with EXPLAIN, nothing is executed, and look for the operators that make an import
+    slow down as the graph grows
+      A CartesianProduct is reported only when one of its sides scans, e.g. not for the product of two
+      unique index seeks of `MATCH (s {id: item.start}) MATCH (e {id: item.end})`.
+    :param session: the session to run EXPLAIN in
+    :param query: the query to check
+    :param parameters: sample parameters, so that the planner sees the same types as the real run
+    :param large_label: a NodeByLabelScan is reported only when its label has more nodes than this
+    :return: the list of problems found, empty when the plan is fine, and the index seeks of the plan
+    """
+    plan = session.run(f"EXPLAIN {query}", parameters).consume().plan
+    problems = []
+    counts = {}
+    for operator in plan_operators(plan):
+        kind = operator_type(operator)
+        if kind == "CartesianProduct":
+            if not any(scan_problem(session, child, large_label, counts)
+                       for side in operator.get("children", []) for child in plan_operators(side)):
+                continue
+        else:
+            kind = scan_problem(session, operator, large_label, counts)
+            if kind is None:
+                continue
+        details = operator_details(operator)
+        problems.append(f"{kind}: {details}" if details else kind)
+    return problems, index_seeks(plan)
@@ -0,0 +1,291 @@
+import json
+import re
+import sys
+import threading
+from pathlib import Path
+
+from util.preflight import operator_type, plan_operators
+
+# statements PROFILE does not apply to
+_UNPROFILABLE = re.compile(r"^\s*(EXPLAIN|PROFILE|CREATE\s+(\w+\s+)?(INDEX|CONSTRAINT|DATABASE)|DROP|SHOW|ALTER|"
+                           r"START|STOP|USE)\b", re.I)
+STATISTICS = ["dbHits", "rows", "pageCacheHits", "pageCacheMisses"]
+# the managed transactions of a session, execute_* since neo4j 5 and *_transaction up to 4.4
+_TRANSACTION_FUNCTIONS = {"execute_write", "execute_read", "write_transaction", "read_transaction"}
+
+
+def hit_ratio(statistics: dict):
+    accesses = statistics.get("pageCacheHits", 0) + statistics.get("pageCacheMisses", 0)
+    return statistics.get("pageCacheHits", 0) / accesses if accesses else None
+
+
+class QueryProfile:
+    """The PROFILE statistics of a query summed over its profiled executions, in total and per operator"""
+
+    def __init__(self, query: str, name: str):
+        self.query = query
+        self.name = name
+        self.executions = 0
+        self.profiled = 0
+        self.totals = dict.fromkeys(STATISTICS, 0)
+        self.operators = {}
+
+    def record(self, profile: dict):
+        self.profiled += 1
+        # operators are identified by their position in the plan, that is the same for every execution of a query
+        for position, operator in enumerate(plan_operators(profile)):
+            key = f"{position:02d} {operator_type(operator)}"
+            totals = self.operators.setdefault(key, dict.fromkeys(STATISTICS, 0))
+            for name in STATISTICS:
+                value = operator.get(name) or 0
+                totals[name] += value
+                # the rows of the query are the ones of its root operator
+                if name != "rows" or position == 0:
+                    self.totals[name] += value
+
+    def summary(self) -> dict:
+        per_execution = lambda totals: {name: value / self.profiled if self.profiled else None
+                                        for name, value in totals.items()}
+        return {
+            "name": self.name,
+            "query": self.query,
+            "executions": self.executions,
+            "profiled": self.profiled,
+            "per_execution": {**per_execution(self.totals), "pageCacheHitRatio": hit_ratio(self.totals)},
+            "operators": {key: {**per_execution(totals), "pageCacheHitRatio": hit_ratio(totals)}
+                          for key, totals in self.operators.items()},
+        }
+
+
+class QueryProfiler:
+    """
+    Run a sampled fraction of the executions of the named queries under PROFILE
+      Queries are named with GraphDBBase.named (batch_store names its query after its description), the first
+      execution of each one and then one every 1 / rate are profiled, and the db hits, rows and page cache
+      hits and misses of every operator are saved to `<profile_dir>/<importer>.json`. The profile of the
+      previous run is kept as `<importer>.previous.json` and compared to the new one when the importer closes.
+      Compare any two profiles with:
+        PYTHONPATH=. python util/profiler.py before.json after.json
+    :param importer: the importer name
+    :param rate: the fraction of the executions to profile
+    """
+
+    def __init__(self, importer: str, rate: float):
+        self.importer = importer
+        self.every = max(1, round(1 / rate))
+        self._names = {}
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def name(self, query: str, name: str):
+        with self._lock:
+            self._names[query] = name
+
+    def sample(self, query: str) -> bool:
+        """Count an execution of query, and tell whether it is to be profiled"""
+        name = self._names.get(query)
+        if name is None or _UNPROFILABLE.match(query):
+            return False
+        with self._lock:
+            profile = self._profiles.get(query)
+            if profile is None:
+                profile = self._profiles[query] = QueryProfile(query, name)
+            profile.executions += 1
+            return (profile.executions - 1) % self.every == 0
+
+    def record(self, query: str, profile: dict):
+        if not profile:
+            return
+        with self._lock:
+            self._profiles[query].record(profile)
+
+    def __bool__(self):
+        return any(profile.profiled for profile in self._profiles.values())
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {"importer": self.importer, "queries": [profile.summary() for profile in self._profiles.values()
+                                                           if profile.profiled]}
+
+    def save(self, directory) -> Path:
+        """Write the profile, keeping the one of the previous run as `<importer>.previous.json`"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{self.importer}.json"
+        if path.is_file():
+            path.replace(directory / f"{self.importer}.previous.json")
+        with path.open("w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        return path
+
+    def report(self, directory) -> str:
+        """The diff of the profile saved in directory against the one of the previous run, if any"""
+        directory = Path(directory)
+        with (directory / f"{self.importer}.json").open(encoding="utf-8") as f:
+            after = json.load(f)
+        previous = directory / f"{self.importer}.previous.json"
+        if not previous.is_file():
+            return diff_report({}, after)
+        with previous.open(encoding="utf-8") as f:
+            return diff_report(json.load(f), after)
+
+
+def _change(before, after):
+    if before is None or after is None:
+        return ""
+    if not before:
+        return "" if not after else " (new)"
+    return f" ({(after - before) / before:+.0%})"
+
+
+def _statistics(before: dict, after: dict):
+    cells = []
+    for name, label in (("dbHits", "db hits"), ("rows", "rows")):
+        b, a = before.get(name), after.get(name)
+        if a is None:
+            continue
+        cells.append(f"{label} {b:.1f} -> {a:.1f}{_change(b, a)}" if b is not None else f"{label} {a:.1f}")
+    b, a = before.get("pageCacheHitRatio"), after.get("pageCacheHitRatio")
+    if a is not None:
+        cells.append(f"page cache hits {b:.1%} -> {a:.1%}" if b is not None else f"page cache hits {a:.1%}")
+    return ", ".join(cells)
+
+
+def diff_report(before: dict, after: dict) -> str:
+    """
+    Compare two saved profiles, query by query (matched by name) and operator by operator, per execution
+    :param before: the profile of the baseline run
+    :param after: the profile of the new run
+    """
+    previous = {query["name"]: query for query in before.get("queries", [])}
+    lines = [f"PROFILE of {after.get('importer')}, per execution, before -> after"]
+    for query in after.get("queries", []):
+        baseline = previous.pop(query["name"], None)
+        if baseline is None:
+            lines.append(f"{query['name']} (new): {_statistics({}, query['per_execution'])}")
+            continue
+        lines.append(f"{query['name']}: {_statistics(baseline['per_execution'], query['per_execution'])}")
+        if baseline["query"] != query["query"]:
+            lines.append("    the query text changed")
+        for key, operator in query["operators"].items():
+            baseline_operator = baseline["operators"].get(key)
+            if baseline_operator is None:
+                lines.append(f"    {key} (new): {_statistics({}, operator)}")
+            elif baseline_operator != operator:
+                lines.append(f"    {key}: {_statistics(baseline_operator, operator)}")
+        for key in baseline["operators"].keys() - query["operators"].keys():
+            lines.append(f"    {key}: removed")
+    for name in previous:
+        lines.append(f"{name}: not run")
+    return "\n".join(lines)
+
+
+def profiled_run(profiler: QueryProfiler, runner, query: str, parameters: dict = None, **kwargs):
+    """Run query with runner (a session or a transaction), under PROFILE when sampled"""
+    if not profiler.sample(query):
+        return runner.run(query, parameters, **kwargs)
+    result = runner.run(f"PROFILE {query}", parameters, **kwargs)
+    records = list(result)
+    summary = result.consume()
+    profiler.record(query, summary.profile)
+    return ProfiledResult(records, summary)
+
+
+class ProfiledResult:
+    """The records and summary of a profiled execution, read at once to get its profile"""
+
+    def __init__(self, records: list, summary):
+        self._records = records
+        self._summary = summary
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def keys(self):
+        return list(self._records[0].keys()) if self._records else []
+
+    def single(self, strict=False):
+        return self._records[0] if self._records else None
+
+    def peek(self):
+        return self.single()
+
+    def data(self, *keys):
+        return [record.data(*keys) for record in self._records]
+
+    def value(self, key=0, default=None):
+        return [record.value(key, default) for record in self._records]
+
+    def values(self, *keys):
+        return [record.values(*keys) for record in self._records]
+
+    def consume(self):
+        return self._summary
+
+
+class ProfilingTransaction:
+    def __init__(self, tx, profiler: QueryProfiler):
+        self._tx = tx
+        self._profiler = profiler
+
+    def run(self, query: str, parameters: dict = None, **kwargs):
+        return profiled_run(self._profiler, self._tx, query, parameters, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return self._tx.__exit__(exc_type, exc_value, tb)
+
+
+class ProfilingSession:
+    def __init__(self, session, profiler: QueryProfiler):
+        self._session = session
+        self._profiler = profiler
+
+    def run(self, query: str, parameters: dict = None, **kwargs):
+        return profiled_run(self._profiler, self._session, query, parameters, **kwargs)
+
+    def begin_transaction(self, *args, **kwargs):
+        return ProfilingTransaction(self._session.begin_transaction(*args, **kwargs), self._profiler)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._session, name)
+        if name not in _TRANSACTION_FUNCTIONS:
+            return attribute
+
+        def execute(work, *args, **kwargs):
+            return attribute(lambda tx, *a, **kw: work(ProfilingTransaction(tx, self._profiler), *a, **kw),
+                             *args, **kwargs)
+        return execute
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._session.close()
+
+
+class ProfilingDriver:
+    """Driver whose sessions run the queries named in profiler under PROFILE, see QueryProfiler"""
+
+    def __init__(self, driver, profiler: QueryProfiler):
+        self._driver = driver
+        self._profiler = profiler
+
+    def session(self, **config):
+        return ProfilingSession(self._driver.session(**config), self._profiler)
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print(sys.argv[0], "<before profile json> <after profile json>")
+        sys.exit(2)
+    with open(sys.argv[1], encoding="utf-8") as before, open(sys.argv[2], encoding="utf-8") as after:
+        print(diff_report(json.load(before), json.load(after)))
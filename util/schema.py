@@ -0,0 +1,105 @@
+import re
+import threading
+
+from neo4j.exceptions import ClientError
+
+_TARGET = re.compile(r"(?:FOR|ON)\s*\(\s*\w*\s*:\s*`?(\w+)`?\s*\)|FOR\s*\(\s*\)\s*-\s*\[\s*\w*\s*:\s*`?(\w+)`?\s*\]", re.I)
+_PROPERTIES = re.compile(r"(?:\bON\s+EACH\s*\[|\bON\s*\((?!\s*\w*\s*:)|\b(?:REQUIRE|ASSERT)\s*\(?)([^\]\)]*?)\)?\s*(?:\]|\)|IS\b|$)", re.I)
+_CREATE = re.compile(r"^(CREATE\s+(?:\w+\s+)?(?:INDEX|CONSTRAINT)(?:\s+(?!FOR\b|ON\b)`?\w+`?)?)\s+", re.I)
+
+
+class SchemaRule:
+    """
+    An index or constraint DDL statement, made idempotent with IF NOT EXISTS
+      `DROP INDEX|CONSTRAINT name IF EXISTS` statements, listed before the rules replacing them, are run as they are
+    :param statement: a `CREATE [kind] INDEX|CONSTRAINT [name] [IF NOT EXISTS] FOR ...` statement
+    """
+
+    def __init__(self, statement: str):
+        statement = " ".join(statement.split()).rstrip(";")
+        if not re.search(r"\bIF\s+NOT\s+EXISTS\b", statement, re.I):
+            statement = _CREATE.sub(r"\1 IF NOT EXISTS ", statement, count=1)
+        self.statement = statement
+        target = _TARGET.search(self.statement)
+        self.target = (target.group(1) or target.group(2)) if target else None
+        properties = _PROPERTIES.search(self.statement)
+        self.properties = tuple(p.strip().split(".")[-1].strip("`") for p in properties.group(1).split(",")) \
+            if properties else ()
+
+    def serves(self, label: str, properties: tuple):
+        """Tell whether an index seek on label(properties) uses this rule"""
+        return label == self.target and set(properties) <= set(self.properties)
+
+    def __repr__(self):
+        return self.statement
+
+
+class SchemaRegistry:
+    """
+    Declarative registry of the indexes and constraints of every database
+      Importers declare the schema they need, the registry applies each database schema once per process,
+      idempotently, and waits with `db.awaitIndexes` for the indexes to be online, so that the first batches
+      of an import never run without them.
+    """
+
+    def __init__(self):
+        self._rules = {}
+        self._applied = set()
+        self._lock = threading.Lock()
+
+    def register(self, database: str, statements: list):
+        with self._lock:
+            rules = self._rules.setdefault(database, {})
+            for statement in statements:
+                rule = SchemaRule(statement)
+                if rule.statement not in rules:
+                    rules[rule.statement] = rule
+                    self._applied.discard(database)
+
+    def rules(self, database: str) -> list:
+        with self._lock:
+            return list(self._rules.get(database, {}).values())
+
+    def apply(self, session, database: str, timeout: int = 300):
+        """
+        Create the rules of database not applied yet and wait for the indexes to come online
+        :param session: a session on database
+        :param database: the database name
+        :param timeout: the seconds to wait for the indexes
+        """
+        with self._lock:
+            if database in self._applied:
+                return
+            rules = list(self._rules.get(database, {}).values())
+            for rule in rules:
+                try:
+                    session.run(rule.statement).consume()
+                except ClientError as e:
+                    # an equivalent rule with a different name is already in place
+                    if e.code != "Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists":
+                        raise e
+            session.run("CALL db.awaitIndexes($timeout)", timeout=timeout).consume()
+            self._applied.add(database)
+
+    def usage_report(self, database: str, index_usage: dict, names: dict = None) -> str:
+        """
+        Describe which queries each rule of database serves
+        :param database: the database name
+        :param index_usage: {query: set of (label, properties)} of the index seeks in the query plans
+        :param names: optional {query: name} used in the report instead of the query text
+        """
+        lines = []
+        for rule in self.rules(database):
+            if rule.target is None:
+                continue
+            queries = [(names or {}).get(query) or " ".join(query.split())[:80]
+                       for query, seeks in index_usage.items()
+                       if any(rule.serves(label, properties) for label, properties in seeks)]
+            lines.append(rule.statement)
+            lines.extend(f"    serves: {query}" for query in queries)
+            if not queries:
+                lines.append("    not used by the import queries")
+        return "\n".join(lines)
+
+
+schema_registry = SchemaRegistry()
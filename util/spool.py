@@ -0,0 +1,98 @@
+import gzip
+import json
+import pickle
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Iterable
+
+from util.checkpoint import fingerprint
+
+
+class Spool:
+    """
+    Rows saved to local compressed chunks, so that the rows produced by an expensive transformation (NLP,
+    entity linking, ...) are computed once and the writes can be run again from them
+      The directory holds `chunk-<n>.pkl.gz` files of chunk_size pickled rows and a `manifest.json` written last:
+      a spool whose writing was interrupted has no manifest and is written again from scratch.
+    :param directory: where the chunks are stored
+    :param chunk_size: the number of rows per chunk
+    :param readers: the number of threads reading (and decompressing) the next chunks ahead of the consumer
+    """
+
+    def __init__(self, directory, chunk_size: int = 10000, readers: int = 4):
+        self.directory = Path(directory)
+        self.chunk_size = chunk_size
+        self.readers = readers
+
+    @property
+    def manifest(self):
+        path = self.directory / "manifest.json"
+        if not path.is_file():
+            return None
+        with path.open(encoding="utf-8") as f:
+            return json.load(f)
+
+    def is_complete(self, source=None):
+        """Tell whether the spool was fully written, from the same source when given"""
+        manifest = self.manifest
+        if manifest is None:
+            return False
+        return source is None or manifest.get("source") == fingerprint(source)
+
+    def __len__(self):
+        manifest = self.manifest
+        return manifest["rows"] if manifest is not None else 0
+
+    def chunk_path(self, index: int):
+        return self.directory / f"chunk-{index:06d}.pkl.gz"
+
+    def write(self, rows: Iterable, source=None, progress=None):
+        """
+        Save rows, replacing the previous content of the spool
+        :param rows: the rows to save
+        :param source: optional file or directory the rows come from, a spool is stale once it changes
+        :param progress: optional ImportProgress to update
+        """
+        self.clear()
+        self.directory.mkdir(parents=True)
+        rows = iter(rows)
+        count, chunks = 0, 0
+        for chunk in iter(lambda: list(islice(rows, self.chunk_size)), []):
+            # compresslevel 1: the spool is written once and read soon after, speed matters more than size
+            with gzip.open(self.chunk_path(chunks), "wb", compresslevel=1) as f:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+            count += len(chunk)
+            chunks += 1
+            if progress is not None:
+                progress.update(len(chunk))
+        if progress is not None:
+            progress.close()
+        manifest = {"rows": count, "chunks": chunks, "chunk_size": self.chunk_size,
+                    "source": fingerprint(source) if source is not None else None}
+        with (self.directory / "manifest.json").open("w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    def read_chunk(self, index: int) -> list:
+        with gzip.open(self.chunk_path(index), "rb") as f:
+            return pickle.load(f)
+
+    def __iter__(self):
+        """The rows of a complete spool, in the order they were written"""
+        manifest = self.manifest
+        if manifest is None:
+            raise RuntimeError(f"spool {self.directory} is not complete")
+        indexes = iter(range(manifest["chunks"]))
+        with ThreadPoolExecutor(max(1, self.readers)) as executor:
+            pending = deque(executor.submit(self.read_chunk, i) for i in islice(indexes, max(1, self.readers)))
+            while pending:
+                chunk = pending.popleft().result()
+                for i in islice(indexes, 1):
+                    pending.append(executor.submit(self.read_chunk, i))
+                yield from chunk
+
+    def clear(self):
+        if self.directory.is_dir():
+            shutil.rmtree(self.directory)
@@ -0,0 +1,125 @@
+from typing import Callable, Iterable
+
+from util.base_importer import BaseImporter
+from util.bulk_export import NodeExport
+
+
+def _labels(node: NodeExport):
+    labels = node.label.split(":")
+    return labels[0], labels[1:]
+
+
+def _properties(mapping, row) -> dict:
+    # drop the neo4j-admin types of the bulk export headers ("name:int")
+    return {name.split(":")[0]: get(row) for name, get in mapping.properties.items()}
+
+
+class TwoPhaseLoader:
+    """
+    Load rows mapped to nodes and relationships in two phases
+      Phase 1 collects the distinct node keys of the whole row stream and writes every node once: with CREATE
+      when its label was empty when the loader started (a first full load), with MERGE otherwise.
+      Phase 2 reads the rows again and MERGEs the relationships MATCHing their endpoints on the keys, that
+      should be backed by a uniqueness constraint or an index.
+    The nodes and relationships are described with the same NodeExport and RelationshipExport used by the
+    bulk export, relationships sharing their endpoints are written in a single pass over the rows:
+        loader = TwoPhaseLoader(importer, [source, destination], [is_a, relation])
+        loader.load(lambda: importer.get_rows(file), checkpoint=file)
+    """
+
+    def __init__(self, importer: BaseImporter, nodes: list, relationships: list = ()):
+        self.importer = importer
+        self.nodes = nodes
+        self.relationships = relationships
+        # detected before writing anything, so that a re-run after a failure falls back to MERGE
+        self.empty_labels = {label for label in {_labels(node)[0] for node in nodes} if self.is_empty(label)}
+
+    def is_empty(self, label: str):
+        with self.importer._driver.session(database=self.importer._database) as session:
+            return session.run(f"MATCH (n:`{label}`) RETURN 1 LIMIT 1").single() is None
+
+    def node_query(self, node: NodeExport):
+        label, extra_labels = _labels(node)
+        write = "CREATE" if label in self.empty_labels else "MERGE"
+        set_labels = "".join(f"\n        SET n:`{extra}`" for extra in extra_labels)
+        set_properties = "\n        SET n += item.properties" if node.properties else ""
+        return f"""
+        UNWIND $batch as item
+        {write} (n:`{label}` {{`{node.id_property}`: item.key}}){set_labels}{set_properties}
+        """
+
+    def relationship_query(self, start: NodeExport, end: NodeExport, relationships: list):
+        writes = []
+        for i, rel in enumerate(relationships):
+            identity = [name.split(":")[0] for name in (rel.properties if rel.merge_on is None else rel.merge_on)]
+            properties = ", ".join(f"`{name}`: item.r{i}.`{name}`" for name in identity)
+            properties = f" {{{properties}}}" if properties else ""
+            pattern = f"MERGE (s)-[r:`{rel.type}`{properties}]->(e) SET r += item.r{i}"
+            writes.append(f"FOREACH (ignoreMe IN CASE WHEN item.r{i} IS NOT NULL THEN [true] ELSE [] END |\n"
+                          f"            {pattern}\n        )")
+        newline = "\n        "
+        return f"""
+        UNWIND $batch as item
+        MATCH (s:`{_labels(start)[0]}` {{`{start.id_property}`: item.start}})
+        MATCH (e:`{_labels(end)[0]}` {{`{end.id_property}`: item.end}})
+        {newline.join(writes)}
+        """
+
+    def collect_nodes(self, rows: Iterable) -> dict:
+        """Phase 1 read: the distinct keys, with the properties of their first occurrence, of every node label"""
+        keys = {}
+        for row in rows:
+            for node in self.nodes:
+                key = node.key(row)
+                if key is None:
+                    continue
+                node_keys = keys.setdefault((node.label, node.id_property), ({}, node))[0]
+                if key not in node_keys:
+                    node_keys[key] = _properties(node, row)
+        return keys
+
+    def relationship_groups(self):
+        groups = {}
+        for rel in self.relationships:
+            endpoints = (rel.start.label, rel.start.id_property, rel.end.label, rel.end.id_property)
+            groups.setdefault(endpoints, []).append(rel)
+        return list(groups.values())
+
+    @staticmethod
+    def relationship_rows(rows: Iterable, relationships: list):
+        start, end = relationships[0].start, relationships[0].end
+        for row in rows:
+            item = {"start": start.key(row), "end": end.key(row)}
+            if item["start"] is None or item["end"] is None:
+                continue
+            found = False
+            for i, rel in enumerate(relationships):
+                if rel.where is not None and not rel.where(row):
+                    item[f"r{i}"] = None
+                else:
+                    item[f"r{i}"] = _properties(rel, row)
+                    found = True
+            if found:
+                yield item
+
+    def load(self, rows: Callable[[], Iterable], desc="", checkpoint=None, **kwargs):
+        """
+        Run both phases
+        :param rows: function returning a new iterator over the rows, it is called once per phase
+                     (and once more for every further group of relationships with different endpoints)
+        :param desc: optional progress bar description
+        :param checkpoint: optional input source to checkpoint the relationships phase, see BaseImporter.batch_store
+        :param kwargs: other batch_store options (e.g. the strategy)
+        """
+        for (label, _), (keys, node) in self.collect_nodes(rows()).items():
+            print(f"{'creating' if _labels(node)[0] in self.empty_labels else 'merging'} {len(keys)} {label} nodes")
+            self.importer.batch_store(self.node_query(node),
+                                      ({"key": key, "properties": properties} for key, properties in keys.items()),
+                                      size=len(keys), desc=f"{desc} {label}".strip(), **kwargs)
+
+        for relationships in self.relationship_groups():
+            types = ", ".join(rel.type for rel in relationships)
+            self.importer.batch_store(self.relationship_query(relationships[0].start, relationships[0].end,
+                                                              relationships),
+                                      self.relationship_rows(rows(), relationships),
+                                      desc=f"{desc} {types}".strip(), checkpoint=checkpoint, **kwargs)